@@ -0,0 +1,456 @@
+"""
+Performance benchmarks for the damage control pipeline.
+
+Usage:
+    python benchmark.py images photo1.jpg photo2.jpg --edges 2048,1600,1024 --qualities 90,85,75 --with-model
+    python benchmark.py whisper --compute-types int8,float32 --threads 2,4,8 --beam-sizes 1,5
+    python benchmark.py startup --runs 5
+    python benchmark.py chunked --processes 4 --chunk-seconds 30
+    python benchmark.py clients --requests 20
+    python benchmark.py output photo1.jpg photo2.jpg --runs 5
+    python benchmark.py shards photo1.jpg ... photo48.jpg --counts 8,16,32,48 --shard-size 12
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Dict, List, Set, Tuple
+
+AUDIO_SAMPLES_DIR = os.path.join("artifakti", "audio files")
+
+
+async def _load_images(sources: List[str]) -> List[Tuple[str, bytes]]:
+    from preuzimanje_slika import download_images
+
+    urls = [s for s in sources if s.startswith(("http://", "https://"))]
+    downloaded = dict(zip(urls, await download_images(urls))) if urls else {}
+
+    images = []
+    for source in sources:
+        if source in downloaded:
+            if downloaded[source] is not None:
+                images.append((source.split('/')[-1], downloaded[source]))
+        else:
+            with open(source, 'rb') as f:
+                images.append((source.split('/')[-1], f.read()))
+    return images
+
+
+def _damage_keys(result: Dict[str, Any]) -> Set[Tuple]:
+    return {
+        (d.get("part"), d.get("type"), d.get("side"))
+        for d in result.get("damages", [])
+        if isinstance(d, dict)
+    }
+
+
+def _f1(reference: Set[Tuple], candidate: Set[Tuple]) -> float:
+    if not reference and not candidate:
+        return 1.0
+    overlap = len(reference & candidate)
+    if overlap == 0:
+        return 0.0
+    precision = overlap / len(candidate)
+    recall = overlap / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+
+async def _benchmark_images(args):
+    from priprema_slika import normalize_image
+
+    images = await _load_images(args.images)
+    names = [name for name, _ in images]
+    original_bytes = sum(len(blob) for _, blob in images)
+    print(f"{len(images)} image(s), {original_bytes / 1024:.0f} KiB original")
+
+    edges = [int(e) for e in args.edges.split(',')]
+    qualities = [int(q) for q in args.qualities.split(',')]
+    configs = [(0, 95)] + [(e, q) for e in edges for q in qualities if e != 0]
+
+    if args.with_model:
+        from vizualna_anliza_ostecenja import inspect_images
+
+    reference = None
+    print(f"{'edge':>6} {'quality':>7} {'KiB':>9} {'ratio':>6} {'prep ms':>8} {'model s':>8} {'damages':>7} {'F1':>5}")
+    for edge, quality in configs:
+        start = time.perf_counter()
+        prepared = [normalize_image(blob, max_long_edge=edge, quality=quality) for _, blob in images]
+        prep_ms = (time.perf_counter() - start) * 1000
+        size = sum(len(blob) for blob, _ in prepared)
+
+        model_s, damages, f1 = "-", "-", "-"
+        if args.with_model:
+            start = time.perf_counter()
+            result = await inspect_images(prepared, names)
+            model_s = f"{time.perf_counter() - start:.2f}"
+            keys = _damage_keys(result)
+            if reference is None:
+                reference = keys
+            damages = str(len(keys))
+            f1 = f"{_f1(reference, keys):.2f}"
+
+        print(f"{edge or 'orig':>6} {quality:>7} {size / 1024:>9.0f} {size / original_bytes:>6.2f} "
+              f"{prep_ms:>8.0f} {model_s:>8} {damages:>7} {f1:>5}")
+
+
+def benchmark_images(args):
+    """
+    Size vs. damage-detection quality tradeoff of the image normalization stage.
+    The first configuration (edge 0 = original size) is the quality reference.
+    """
+    asyncio.run(_benchmark_images(args))
+
+
+def _run_whisper_config(files: List[str], compute_type: str, cpu_threads: int,
+                        beam_size: int, vad_filter: bool) -> Dict[str, float]:
+    # runs in a fresh process, so ru_maxrss is the peak of this configuration only
+    from faster_whisper import WhisperModel
+    from konfiguracija import WHISPER_MODEL_NAME
+
+    start = time.perf_counter()
+    model = WhisperModel(WHISPER_MODEL_NAME, device="cpu",
+                         compute_type=compute_type, cpu_threads=cpu_threads)
+    load_s = time.perf_counter() - start
+
+    audio_s, decode_s = 0.0, 0.0
+    for path in files:
+        start = time.perf_counter()
+        segments, info = model.transcribe(path, beam_size=beam_size, vad_filter=vad_filter)
+        "".join(segment.text for segment in segments)
+        decode_s += time.perf_counter() - start
+        audio_s += info.duration
+
+    return {
+        "load_s": load_s,
+        "audio_s": audio_s,
+        "decode_s": decode_s,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def benchmark_whisper(args):
+    """
+    Real-time factor and peak RSS of Whisper inference settings over the audio samples.
+    Each configuration runs in its own process.
+    """
+    files = sorted(glob.glob(os.path.join(args.audio_dir, "*")))
+    if not files:
+        raise SystemExit(f"No audio files found in {args.audio_dir}")
+    print(f"{len(files)} audio file(s) from {args.audio_dir}")
+
+    matrix = itertools.product(args.compute_types.split(','),
+                               [int(t) for t in args.threads.split(',')],
+                               [int(b) for b in args.beam_sizes.split(',')],
+                               [v == "true" for v in args.vad.split(',')])
+
+    print(f"{'compute':>13} {'threads':>7} {'beam':>4} {'vad':>5} {'load s':>7} {'RTF':>6} {'peak RSS MB':>11}")
+    for compute_type, cpu_threads, beam_size, vad_filter in matrix:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            stats = executor.submit(_run_whisper_config, files, compute_type, cpu_threads,
+                                    beam_size, vad_filter).result()
+        rtf = stats["decode_s"] / stats["audio_s"] if stats["audio_s"] else float("nan")
+        print(f"{compute_type:>13} {cpu_threads:>7} {beam_size:>4} {str(vad_filter):>5} "
+              f"{stats['load_s']:>7.1f} {rtf:>6.3f} {stats['peak_rss_mb']:>11.0f}")
+
+
+def _rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def benchmark_startup(args):
+    """
+    Import time of the app module and time until /ready answers 200, with the server's RSS at that point
+    """
+    import_times = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], check=True)
+        import_times.append(time.perf_counter() - start)
+    import_times.sort()
+    print(f"import main: median {import_times[len(import_times) // 2]:.2f}s, "
+          f"min {import_times[0]:.2f}s, max {import_times[-1]:.2f}s")
+
+    ready_url = f"http://127.0.0.1:{args.port}/ready"
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port)],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                if server.poll() is not None:
+                    raise SystemExit("Server exited before becoming ready")
+                try:
+                    with urllib.request.urlopen(ready_url, timeout=1) as resp:
+                        if resp.status == 200:
+                            break
+                except (urllib.error.URLError, ConnectionError):
+                    pass
+                time.sleep(0.1)
+            print(f"ready after {time.perf_counter() - start:.2f}s, RSS {_rss_mb(server.pid):.0f} MB")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def _word_error_rate(reference: str, hypothesis: str) -> float:
+    ref, hyp = reference.lower().split(), hypothesis.lower().split()
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def benchmark_chunked(args):
+    """
+    Wall-clock time and accuracy of parallel chunked transcription against the single-stream path.
+    The single-stream transcript is the accuracy reference.
+    """
+    import numpy as np
+    from faster_whisper.audio import decode_audio
+    from transkripcija import (load_whisper_model, iter_chunked_segments, _create_chunk_executor,
+                               _transcribe_chunk, SAMPLING_RATE)
+    from konfiguracija import WHISPER_BEAM_SIZE, WHISPER_VAD_FILTER
+
+    files = args.files or sorted(glob.glob(os.path.join(AUDIO_SAMPLES_DIR, "*")))
+    model = load_whisper_model()
+    executor = _create_chunk_executor(args.processes)
+    # load the model in every worker process before timing anything
+    silence = np.zeros(SAMPLING_RATE, dtype=np.float32)
+    list(executor.map(_transcribe_chunk, [silence] * args.processes,
+                      [1] * args.processes, [False] * args.processes))
+
+    print(f"{'file':>40} {'audio s':>8} {'single s':>9} {'chunked s':>10} {'speedup':>8} {'WER':>6}")
+    try:
+        for path in files:
+            audio = decode_audio(path, sampling_rate=SAMPLING_RATE)
+
+            start = time.perf_counter()
+            segments, _ = model.transcribe(audio, beam_size=WHISPER_BEAM_SIZE, vad_filter=WHISPER_VAD_FILTER)
+            reference = "".join(segment.text for segment in segments)
+            single_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            chunked = "".join(segment.text for segment in
+                              iter_chunked_segments(audio, executor, chunk_seconds=args.chunk_seconds))
+            chunked_s = time.perf_counter() - start
+
+            print(f"{os.path.basename(path)[-40:]:>40} {len(audio) / SAMPLING_RATE:>8.1f} {single_s:>9.1f} "
+                  f"{chunked_s:>10.1f} {single_s / chunked_s:>8.2f} {_word_error_rate(reference, chunked):>6.3f}")
+    finally:
+        executor.shutdown()
+
+
+async def _benchmark_clients(args):
+    from io import BytesIO
+    from PIL import Image, ImageDraw
+    import konfiguracija
+
+    img = Image.new("RGB", (400, 100), "white")
+    ImageDraw.Draw(img).text((10, 40), "BG-1903-CB 17.08.2024", fill="black")
+    stream = BytesIO()
+    img.save(stream, format="PNG")
+    png = stream.getvalue()
+
+    async def openai_call(client):
+        await client.chat.completions.create(model=konfiguracija.OPENAI_MODEL_NAME, max_tokens=1,
+                                             messages=[{"role": "user", "content": "ping"}])
+
+    async def ocr_call(client):
+        poller = await client.begin_analyze_document(model_id="prebuilt-layout", body=BytesIO(png),
+                                                     content_type="image/png",
+                                                     polling_interval=konfiguracija.OCR_POLLING_INTERVAL)
+        await poller.result()
+
+    services = {
+        "openai": (openai_call, konfiguracija.create_async_openai_client,
+                   lambda: konfiguracija.get_async_openai_credentials()[1]),
+        "ocr": (ocr_call, konfiguracija.create_async_document_intel_client,
+                konfiguracija.get_async_document_intel_object),
+    }
+
+    print(f"{'service':>8} {'mode':>7} {'first ms':>9} {'median ms':>10} {'p90 ms':>8}")
+    for name in args.services.split(','):
+        call, create, get_shared = services[name]
+        for mode in ("per-call", "pooled"):
+            latencies = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                if mode == "per-call":
+                    # previous behaviour: a new client (and TLS handshake) for every request
+                    client = create()
+                    try:
+                        await call(client)
+                    finally:
+                        await client.close()
+                else:
+                    await call(get_shared())
+                latencies.append((time.perf_counter() - start) * 1000)
+            first, ordered = latencies[0], sorted(latencies)
+            print(f"{name:>8} {mode:>7} {first:>9.0f} {ordered[len(ordered) // 2]:>10.0f} "
+                  f"{ordered[int(len(ordered) * 0.9)]:>8.0f}")
+    await konfiguracija.close_clients()
+
+
+def benchmark_clients(args):
+    """
+    Per-request latency with a new upstream client per call versus the shared client registry
+    """
+    asyncio.run(_benchmark_clients(args))
+
+
+async def _benchmark_output(args):
+    from priprema_slika import normalize_image
+    from vizualna_anliza_ostecenja import run_inspection
+
+    images = await _load_images(args.images)
+    names = [name for name, _ in images]
+    prepared = [normalize_image(blob) for _, blob in images]
+    print(f"{len(images)} image(s), {args.runs} run(s) per mode")
+
+    reference = None
+    print(f"{'mode':>10} {'median s':>9} {'prompt tok':>11} {'output tok':>11} {'failures':>9} {'damages':>8} {'F1':>5}")
+    for mode in args.modes.split(','):
+        latencies, prompt_tokens, output_tokens = [], [], []
+        failures = 0
+        keys = set()
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result, usage = await run_inspection(prepared, names, mode)
+            latencies.append(time.perf_counter() - start)
+            prompt_tokens.append(usage["prompt_tokens"] or 0)
+            output_tokens.append(usage["completion_tokens"] or 0)
+            # an unparseable answer would have to be retried
+            if "error" in result or result.get("dropped_damages"):
+                failures += 1
+            keys = _damage_keys(result)
+        if reference is None:
+            reference = keys
+        print(f"{mode:>10} {sorted(latencies)[len(latencies) // 2]:>9.2f} "
+              f"{sum(prompt_tokens) / args.runs:>11.0f} {sum(output_tokens) / args.runs:>11.0f} "
+              f"{failures:>9} {len(keys):>8} {_f1(reference, keys):>5.2f}")
+
+
+def benchmark_output(args):
+    """
+    Free-text JSON prompt versus schema-constrained output with index-encoded labels.
+    Detected damages of the last run are compared against the first mode.
+    """
+    asyncio.run(_benchmark_output(args))
+
+
+async def _benchmark_shards(args):
+    from priprema_slika import normalize_image
+    from vizualna_anliza_ostecenja import inspect_images, inspect_in_shards
+
+    images = await _load_images(args.images)
+    prepared = [(name, normalize_image(blob)) for name, blob in images]
+    print(f"{len(images)} distinct image(s), shard size {args.shard_size}, concurrency {args.concurrency}")
+
+    print(f"{'photos':>6} {'mode':>8} {'seconds':>8} {'shards':>6} {'damages':>8} {'F1':>5}")
+    for count in (int(c) for c in args.counts.split(',')):
+        # photo sets larger than the sample are filled up by repeating it
+        subset = list(itertools.islice(itertools.cycle(prepared), count))
+        names = [f"{i}_{name}" for i, (name, _) in enumerate(subset)]
+        subset = [image for _, image in subset]
+
+        start = time.perf_counter()
+        try:
+            single = await inspect_images(subset, names)
+        except Exception as e:  # typically the request size limit
+            single = {"error": str(e)}
+        single_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sharded, shards = await inspect_in_shards(subset, names, shard_size=args.shard_size,
+                                                  concurrency=args.concurrency)
+        sharded_s = time.perf_counter() - start
+
+        reference = _damage_keys(single)
+        keys = _damage_keys(sharded)
+        single_damages = "error" if "error" in single else str(len(reference))
+        print(f"{count:>6} {'single':>8} {single_s:>8.2f} {1:>6} {single_damages:>8} {'-':>5}")
+        print(f"{count:>6} {'sharded':>8} {sharded_s:>8.2f} {shards:>6} {len(keys):>8} "
+              f"{_f1(reference, keys) if 'error' not in single else float('nan'):>5.2f}")
+
+
+def benchmark_shards(args):
+    """
+    Latency against photo count for single-shot and sharded damage inspection.
+    F1 compares the sharded damages against the single-shot ones.
+    """
+    asyncio.run(_benchmark_shards(args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    images = subparsers.add_parser("images", help="image normalization size/quality tradeoff")
+    images.add_argument("images", nargs="+", help="image files or URLs")
+    images.add_argument("--edges", default="2048,1600,1280,1024,768", help="comma separated long-edge targets")
+    images.add_argument("--qualities", default="90,85,75", help="comma separated JPEG qualities")
+    images.add_argument("--with-model", action="store_true", help="also run Gemini and compare detected damages")
+    images.set_defaults(func=benchmark_images)
+
+    whisper = subparsers.add_parser("whisper", help="Whisper inference settings matrix (RTF, peak RSS)")
+    whisper.add_argument("--audio-dir", default=AUDIO_SAMPLES_DIR, help="directory with audio samples")
+    whisper.add_argument("--compute-types", default="int8,int8_float32,float32", help="comma separated compute types")
+    whisper.add_argument("--threads", default=str(os.cpu_count() or 4), help="comma separated cpu_threads values")
+    whisper.add_argument("--beam-sizes", default="1,5", help="comma separated beam sizes")
+    whisper.add_argument("--vad", default="true,false", help="comma separated VAD filter values")
+    whisper.set_defaults(func=benchmark_whisper)
+
+    startup = subparsers.add_parser("startup", help="app import time and time to /ready")
+    startup.add_argument("--runs", type=int, default=5, help="number of repetitions")
+    startup.add_argument("--port", type=int, default=8765, help="port for the test server")
+    startup.set_defaults(func=benchmark_startup)
+
+    chunked = subparsers.add_parser("chunked", help="parallel chunked vs. single-stream transcription")
+    chunked.add_argument("files", nargs="*", help=f"audio files (default: {AUDIO_SAMPLES_DIR})")
+    chunked.add_argument("--processes", type=int, default=4, help="number of chunk worker processes")
+    chunked.add_argument("--chunk-seconds", type=float, default=30, help="target chunk length")
+    chunked.set_defaults(func=benchmark_chunked)
+
+    clients = subparsers.add_parser("clients", help="per-call vs. pooled upstream client latency")
+    clients.add_argument("--requests", type=int, default=20, help="requests per service and mode")
+    clients.add_argument("--services", default="openai,ocr", help="comma separated: openai, ocr")
+    clients.set_defaults(func=benchmark_clients)
+
+    output = subparsers.add_parser("output", help="free-text vs. structured damage output (tokens, latency)")
+    output.add_argument("images", nargs="+", help="image files or URLs")
+    output.add_argument("--runs", type=int, default=5, help="inspections per mode")
+    output.add_argument("--modes", default="text,structured", help="comma separated: text, structured")
+    output.set_defaults(func=benchmark_output)
+
+    shards = subparsers.add_parser("shards", help="single-shot vs. sharded inspection latency by photo count")
+    shards.add_argument("images", nargs="+", help="image files or URLs")
+    shards.add_argument("--counts", default="4,8,16,32,48", help="comma separated photo counts")
+    shards.add_argument("--shard-size", type=int, default=12, help="images per shard")
+    shards.add_argument("--concurrency", type=int, default=4, help="concurrent shard calls")
+    shards.set_defaults(func=benchmark_shards)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
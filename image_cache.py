@@ -0,0 +1,149 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class ImageCache:
+    """
+    On-disk, content-addressed cache for downloaded images.
+    URLs map to the SHA-256 of their content together with the ETag/Last-Modified
+    validators, so the same photo under two URLs is stored only once.
+    Blobs are evicted in least-recently-used order once the size cap is exceeded.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(directory, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.db_path = os.path.join(directory, "index.sqlite")
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS urls ("
+                "url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, etag TEXT, last_modified TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached entry for a URL (sha256, etag, last_modified) or None
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT u.sha256, u.etag, u.last_modified FROM urls u "
+                "JOIN blobs b ON b.sha256 = u.sha256 WHERE u.url = ?",
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"sha256": row[0], "etag": row[1], "last_modified": row[2]}
+
+    def validation_headers(self, entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Conditional request headers for revalidating a cached entry
+        """
+        headers = {}
+        if entry is None:
+            return headers
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read(self, sha256: str) -> Optional[bytes]:
+        """
+        Reads a blob by its content hash and marks it as recently used
+        """
+        try:
+            with open(self._blob_path(sha256), "rb") as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return None
+        with self._connect() as conn:
+            conn.execute("UPDATE blobs SET last_access = ? WHERE sha256 = ?", (time.time(), sha256))
+        with self._lock:
+            self.hits += 1
+        return blob
+
+    def store(self, url: str, blob: bytes,
+              etag: Optional[str] = None,
+              last_modified: Optional[str] = None) -> str:
+        """
+        Stores a downloaded blob under its content hash and (re)points the URL at it
+        """
+        sha256 = hashlib.sha256(blob).hexdigest()
+        path = self._blob_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO blobs (sha256, size, last_access) VALUES (?, ?, ?)",
+                (sha256, len(blob), time.time())
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO urls (url, sha256, etag, last_modified) VALUES (?, ?, ?, ?)",
+                (url, sha256, etag, last_modified)
+            )
+        with self._lock:
+            self.misses += 1
+        self._evict()
+        return sha256
+
+    def _evict(self):
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = conn.execute("SELECT sha256, size FROM blobs ORDER BY last_access").fetchall()
+            for sha256, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+                conn.execute("DELETE FROM urls WHERE sha256 = ?", (sha256,))
+                try:
+                    os.remove(self._blob_path(sha256))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            blob_count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            url_count = conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "urls": url_count,
+                "blobs": blob_count,
+                "size_bytes": total,
+                "max_bytes": self.max_bytes,
+            }
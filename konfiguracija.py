@@ -1,41 +1,228 @@
 import os
-from openai import AzureOpenAI
+import inspect
+import threading
+import aiohttp
+import httpx
+from openai import AzureOpenAI, AsyncAzureOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.ai.documentintelligence.aio import DocumentIntelligenceClient as AsyncDocumentIntelligenceClient
 from google.genai import types
 from google import genai
 
 load_dotenv()
 
-def get_document_intel_object():
+# --- Image download settings ---
+IMAGE_DOWNLOAD_TIMEOUT = float(os.getenv("IMAGE_DOWNLOAD_TIMEOUT", "15"))
+IMAGE_BATCH_DEADLINE = float(os.getenv("IMAGE_BATCH_DEADLINE", "60"))
+IMAGE_DOWNLOAD_PER_HOST = int(os.getenv("IMAGE_DOWNLOAD_PER_HOST", "8"))
+IMAGE_DOWNLOAD_MAX_CONNECTIONS = int(os.getenv("IMAGE_DOWNLOAD_MAX_CONNECTIONS", "32"))
+IMAGE_DOWNLOAD_KEEPALIVE = float(os.getenv("IMAGE_DOWNLOAD_KEEPALIVE", "30"))
+
+# --- Damage case API settings ---
+DAMAGE_CASE_API_URL = os.getenv("DAMAGE_CASE_API_URL",
+                                "https://api-prod.orange.sixt.com/v1/vehicle-damage/external/damage-cases")
+DAMAGE_CASE_SOURCE = os.getenv("DAMAGE_CASE_SOURCE", "AAA-1-RENT")
+# used when the request does not bring its own token
+DAMAGE_CASE_API_TOKEN = os.getenv("DAMAGE_CASE_API_TOKEN", "")
+DAMAGE_CASE_API_TIMEOUT = float(os.getenv("DAMAGE_CASE_API_TIMEOUT", "15"))
+
+# --- Image cache settings ---
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(".cache", "images"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# --- Image preprocessing settings ---
+IMAGE_PREPROCESS_ENABLED = os.getenv("IMAGE_PREPROCESS_ENABLED", "true").lower() == "true"
+IMAGE_MAX_LONG_EDGE = int(os.getenv("IMAGE_MAX_LONG_EDGE", "1600"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", str(os.cpu_count() or 2)))
+# near-identical photos (perceptual hash distance up to the threshold, out of 64 bits) are inspected once
+IMAGE_DEDUP_ENABLED = os.getenv("IMAGE_DEDUP_ENABLED", "true").lower() == "true"
+IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv("IMAGE_DEDUP_MAX_DISTANCE", "6"))
+
+# --- Upload settings ---
+MAX_AUDIO_UPLOAD_BYTES = int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", str(200 * 1024 ** 2)))
+MAX_REPORT_UPLOAD_BYTES = int(os.getenv("MAX_REPORT_UPLOAD_BYTES", str(50 * 1024 ** 2)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 ** 2)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(".cache", "uploads"))
+# spooled files older than this are left over by jobs that never ran, removed at startup
+UPLOAD_SPOOL_MAX_AGE_SECONDS = float(os.getenv("UPLOAD_SPOOL_MAX_AGE_SECONDS", str(6 * 3600)))
+
+# --- Upstream client pool settings ---
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "32"))
+UPSTREAM_KEEPALIVE_SECONDS = float(os.getenv("UPSTREAM_KEEPALIVE_SECONDS", "60"))
+
+# --- Report OCR settings ---
+OCR_MODEL_ID = os.getenv("OCR_MODEL_ID", "prebuilt-layout")
+OCR_POLLING_INTERVAL = float(os.getenv("OCR_POLLING_INTERVAL", "1"))
+OCR_DEADLINE_SECONDS = float(os.getenv("OCR_DEADLINE_SECONDS", "120"))
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true"
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join(".cache", "ocr.sqlite"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+# concurrent layout calls per process, across all requests
+OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", "8"))
+
+# --- Multi-page PDF settings ---
+# PDFs are split into chunks of this many pages that are OCR'd concurrently
+PDF_PAGES_PER_CHUNK = int(os.getenv("PDF_PAGES_PER_CHUNK", "2"))
+PDF_OCR_CONCURRENCY = int(os.getenv("PDF_OCR_CONCURRENCY", "4"))
+# only pages that look like they hold report fields are sent to the LLM
+PDF_PAGE_FILTER_ENABLED = os.getenv("PDF_PAGE_FILTER_ENABLED", "true").lower() == "true"
+# number of signal kinds (plate, date, party) a page needs to count as relevant
+PDF_PAGE_MIN_SIGNALS = int(os.getenv("PDF_PAGE_MIN_SIGNALS", "2"))
+# pages whose embedded text layer looks complete skip Azure OCR
+PDF_TEXT_LAYER_ENABLED = os.getenv("PDF_TEXT_LAYER_ENABLED", "true").lower() == "true"
+PDF_TEXT_LAYER_MIN_CHARS = int(os.getenv("PDF_TEXT_LAYER_MIN_CHARS", "200"))
+PDF_TEXT_LAYER_MIN_SCORE = float(os.getenv("PDF_TEXT_LAYER_MIN_SCORE", "0.9"))
+
+# --- LLM extraction cache settings ---
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+# concurrent extraction calls per process, across all requests
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# --- Report batch settings ---
+REPORT_BATCH_CONCURRENCY = int(os.getenv("REPORT_BATCH_CONCURRENCY", "16"))
+REPORT_BATCH_MAX_ITEMS = int(os.getenv("REPORT_BATCH_MAX_ITEMS", "500"))
+MAX_REPORT_BATCH_BYTES = int(os.getenv("MAX_REPORT_BATCH_BYTES", str(2 * 1024 ** 3)))
+
+# --- Model lifecycle settings ---
+# lazy | eager | idle_unload
+WHISPER_LIFECYCLE = os.getenv("WHISPER_LIFECYCLE", "lazy")
+GEMINI_LIFECYCLE = os.getenv("GEMINI_LIFECYCLE", "lazy")
+MODEL_IDLE_TIMEOUT = float(os.getenv("MODEL_IDLE_TIMEOUT", "900"))
+MODEL_IDLE_CHECK_INTERVAL = float(os.getenv("MODEL_IDLE_CHECK_INTERVAL", "30"))
+
+# --- Whisper inference settings ---
+WHISPER_MODEL_NAME = os.getenv("WHISPER_MODEL_NAME", "large-v3-turbo")
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+# 0 lets CTranslate2 pick its default number of threads
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "1"))
+WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "5"))
+WHISPER_VAD_FILTER = os.getenv("WHISPER_VAD_FILTER", "true").lower() == "true"
+# empty lets Whisper detect the language
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE") or None
+# number of model replicas, "auto" sizes the pool to the available cores
+_WHISPER_POOL_SIZE = os.getenv("WHISPER_POOL_SIZE", "1")
+if _WHISPER_POOL_SIZE == "auto":
+    WHISPER_POOL_SIZE = max(1, (os.cpu_count() or 1) // (WHISPER_CPU_THREADS or 4))
+else:
+    WHISPER_POOL_SIZE = int(_WHISPER_POOL_SIZE)
+
+# --- Long audio (parallel chunked transcription) settings ---
+LONG_AUDIO_THRESHOLD_SECONDS = float(os.getenv("LONG_AUDIO_THRESHOLD_SECONDS", "300"))
+LONG_AUDIO_CHUNK_SECONDS = float(os.getenv("LONG_AUDIO_CHUNK_SECONDS", "120"))
+# every process loads its own model replica, 1 disables chunked transcription
+LONG_AUDIO_PROCESSES = int(os.getenv("LONG_AUDIO_PROCESSES", str(max(1, (os.cpu_count() or 1) // 4))))
+
+# --- Transcription job queue settings ---
+# one worker per model replica, so a job is only "running" once it has a model
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", str(WHISPER_POOL_SIZE)))
+TRANSCRIPTION_QUEUE_SIZE = int(os.getenv("TRANSCRIPTION_QUEUE_SIZE", "32"))
+
+# --- Transcription job store settings ---
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "sqlite")
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(".cache", "jobs.sqlite"))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "86400"))
+
+# --- Damage inspection settings ---
+# structured: schema-constrained JSON with label indices, text: free-text JSON prompt
+DAMAGE_OUTPUT_MODE = os.getenv("DAMAGE_OUTPUT_MODE", "structured")
+# photo sets larger than the shard size are inspected in concurrent shards and merged
+INSPECTION_SHARDING_ENABLED = os.getenv("INSPECTION_SHARDING_ENABLED", "true").lower() == "true"
+INSPECTION_SHARD_SIZE = int(os.getenv("INSPECTION_SHARD_SIZE", "12"))
+INSPECTION_SHARD_CONCURRENCY = int(os.getenv("INSPECTION_SHARD_CONCURRENCY", "4"))
+# findings stored per inspected shard, so a resubmitted case only inspects its new photos
+INCREMENTAL_INSPECTION_ENABLED = os.getenv("INCREMENTAL_INSPECTION_ENABLED", "true").lower() == "true"
+FINDINGS_CACHE_PATH = os.getenv("FINDINGS_CACHE_PATH", os.path.join(".cache", "findings.sqlite"))
+FINDINGS_CACHE_MAX_BYTES = int(os.getenv("FINDINGS_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))
+
+# --- Damage inspection result cache settings ---
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512"))
+
+# --- Upstream client registry ---
+# every client is created once per process and shares its HTTP connection pool
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+OPENAI_MODEL_NAME = "gpt-4o"
+
+def _get_client(name, factory):
+    with _CLIENTS_LOCK:
+        if name not in _CLIENTS:
+            _CLIENTS[name] = factory()
+        return _CLIENTS[name]
+
+def create_async_document_intel_client():
     """
-    Loads necessary environment variables and returns a DocumentIntelligenceClient object
+    Builds an async DocumentIntelligenceClient on a pooled aiohttp session.
+    Must be called from the event loop that will use it.
     """
-    API_KEY = os.getenv("DNET_API_KEY")
-    endpoint = os.getenv("DNET_ENDPOINT")
-    credentials = AzureKeyCredential(API_KEY)
+    connector = aiohttp.TCPConnector(limit=UPSTREAM_MAX_CONNECTIONS,
+                                     keepalive_timeout=UPSTREAM_KEEPALIVE_SECONDS)
+    session = aiohttp.ClientSession(connector=connector)
+    credentials = AzureKeyCredential(os.getenv("DNET_API_KEY"))
 
-    document_intelligence_client = DocumentIntelligenceClient(endpoint, credentials)
+    return AsyncDocumentIntelligenceClient(os.getenv("DNET_ENDPOINT"), credentials,
+                                           transport=AioHttpTransport(session=session, session_owner=True))
 
-    return document_intelligence_client
+def _httpx_limits():
+    return httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS,
+                        max_keepalive_connections=UPSTREAM_MAX_CONNECTIONS,
+                        keepalive_expiry=UPSTREAM_KEEPALIVE_SECONDS)
 
-def get_openai_credentials():
-    client = AzureOpenAI(
+def create_openai_client():
+    return AzureOpenAI(
         api_version= os.getenv("API_VERSION"),
         azure_endpoint=os.getenv("DNET_AZURE_ENDPOINT"),
         api_key=os.getenv("DNET_OPENAI_API_KEY"),
+        http_client=DefaultHttpxClient(limits=_httpx_limits()),
     )
-    model = "gpt-4o"
 
-    return model, client
+def create_async_openai_client():
+    return AsyncAzureOpenAI(
+        api_version= os.getenv("API_VERSION"),
+        azure_endpoint=os.getenv("DNET_AZURE_ENDPOINT"),
+        api_key=os.getenv("DNET_OPENAI_API_KEY"),
+        http_client=DefaultAsyncHttpxClient(limits=_httpx_limits()),
+    )
+
+def get_async_document_intel_object():
+    """
+    Returns the process-wide async DocumentIntelligenceClient, for use on the event loop
+    """
+    return _get_client("document_intelligence_async", create_async_document_intel_client)
+
+def get_openai_credentials():
+    return OPENAI_MODEL_NAME, _get_client("openai", create_openai_client)
+
+def get_async_openai_credentials():
+    return OPENAI_MODEL_NAME, _get_client("openai_async", create_async_openai_client)
+
+async def close_clients():
+    """
+    Closes every registered client (called on app shutdown)
+    """
+    with _CLIENTS_LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+    for client in clients:
+        result = client.close()
+        if inspect.isawaitable(result):
+            await result
+
+GEMINI_MODEL_NAME = os.getenv("MODEL_NAME")
 
 def get_gemini_credentials():
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-    MODEL_NAME = os.getenv("MODEL_NAME")
     client = genai.Client(api_key=GEMINI_API_KEY)
 
-    return client, MODEL_NAME
+    return client, GEMINI_MODEL_NAME
 
 VEHICLE_PARTS_CONFIGURATION = {
 
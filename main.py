@@ -1,14 +1,57 @@
 import os
-from io import BytesIO
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form
-from fastapi.responses import JSONResponse
-from opticka_analiza_izvestaja import analyse_document, analyse_audio
-from vizualna_anliza_ostecenja import AnalyzeBatchRequest, batch_inspect
-from transcriptions_store import TRANSCRIPTION_DATA
-from typing import Optional, Literal
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from opticka_analiza_izvestaja import (
+    analyse_document,
+    iter_report_batch,
+    report_input_type,
+    PageRangeError,
+    analyse_audio,
+    OCR_CACHE,
+    LLM_CACHE,
+    LLM_SINGLEFLIGHT,
+    LLM_ASYNC_SINGLEFLIGHT,
+)
+from vizualna_anliza_ostecenja import (
+    AnalyzeBatchRequest,
+    AnalyzeCaseRequest,
+    CaseNotFoundError,
+    CaseApiError,
+    batch_inspect,
+    stream_batch_inspect,
+    case_inspect,
+    RESULT_CACHE,
+    FINDINGS_CACHE,
+)
+from preuzimanje_slika import close_http_client, IMAGE_CACHE
+from transcriptions_store import TRANSCRIPTION_STORE
+from transcription_queue import TranscriptionScheduler, QueueFullError
+from konfiguracija import (
+    TRANSCRIPTION_WORKERS,
+    TRANSCRIPTION_QUEUE_SIZE,
+    MAX_AUDIO_UPLOAD_BYTES,
+    MAX_REPORT_UPLOAD_BYTES,
+    MAX_REPORT_BATCH_BYTES,
+    REPORT_BATCH_MAX_ITEMS,
+    close_clients,
+)
+from upload_spool import (
+    UploadLimitMiddleware,
+    check_upload_size,
+    spool_upload_to_disk,
+    extract_zip_to_disk,
+    remove_spooled,
+    sweep_spool_dir,
+)
+from promptovi import OUTPUT_FORMS, PROMPTS
+from model_lifecycle import LIFECYCLE
+from typing import List, Optional, Literal
 import logging
+import json
 import uuid
-import threading
+import zipfile
 
 # --- Logging setup ---
 logging.basicConfig(level=logging.INFO,
@@ -17,6 +60,42 @@ logging.basicConfig(level=logging.INFO,
 logger = logging.getLogger(__name__)
 
 
+def transcription_job(audio_path, on_event=None):
+    """
+    Transcribes a spooled upload and removes it afterwards
+    """
+    try:
+        if on_event is None:
+            return analyse_audio(audio_path)
+        return analyse_audio(audio_path, on_event=on_event)
+    finally:
+        os.remove(audio_path)
+
+
+TRANSCRIPTION_SCHEDULER = TranscriptionScheduler(job=transcription_job,
+                                                 store=TRANSCRIPTION_STORE,
+                                                 workers=TRANSCRIPTION_WORKERS,
+                                                 max_queued=TRANSCRIPTION_QUEUE_SIZE,
+                                                 discard=remove_spooled)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    orphaned = await asyncio.to_thread(TRANSCRIPTION_STORE.fail_orphaned)
+    if orphaned:
+        logger.warning("Marked %d transcription job(s) left over by a previous process as failed.", orphaned)
+    # uploads of jobs that never ran, e.g. ones orphaned by a crash
+    await asyncio.to_thread(sweep_spool_dir)
+    # eager models are loaded and warmed up in the background (see /ready), lazy ones on first use
+    LIFECYCLE.start()
+    TRANSCRIPTION_SCHEDULER.start()
+    yield
+    TRANSCRIPTION_SCHEDULER.stop()
+    LIFECYCLE.stop()
+    # release pooled upstream connections
+    await close_http_client()
+    await close_clients()
+
 
 app = FastAPI(
     title="Vehicle Damage Analyzer",
@@ -25,13 +104,52 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    lifespan=lifespan,
 )
 
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/transcribe": MAX_AUDIO_UPLOAD_BYTES,
+    "/transcribe_stream": MAX_AUDIO_UPLOAD_BYTES,
+    "/analyze_report": MAX_REPORT_UPLOAD_BYTES,
+    "/analyze_report_batch": MAX_REPORT_BATCH_BYTES,
+})
+
 @app.get("/")
 def read_root():
     return {"Naslov": "Damage Control API"}
 
 
+@app.get("/ready")
+def ready():
+    status = {"ready": LIFECYCLE.ready(), "models": LIFECYCLE.status()}
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+
+@app.get("/cache_stats")
+def cache_stats():
+    stats = {}
+    if IMAGE_CACHE is not None:
+        stats["image_cache"] = IMAGE_CACHE.stats()
+    stats["result_cache"] = RESULT_CACHE.stats()
+    if FINDINGS_CACHE is not None:
+        stats["findings_cache"] = FINDINGS_CACHE.stats()
+    if OCR_CACHE is not None:
+        stats["ocr_cache"] = OCR_CACHE.stats()
+    stats["llm_cache"] = dict(LLM_CACHE.stats(),
+                              coalesced=LLM_SINGLEFLIGHT.coalesced + LLM_ASYNC_SINGLEFLIGHT.coalesced)
+    return stats
+
+
+@app.get("/prompts")
+def prompts():
+    """
+    Version, fingerprint and static prefix size in tokens of every prompt template
+    """
+    return PROMPTS.report()
+
+
 @app.post(
     "/analyze_batch",
     summary="Batch-inspect damage images",
@@ -42,6 +160,7 @@ async def analyze_batch(req: AnalyzeBatchRequest):
     """
     Batch-inspect a set of vehicle damage images.
     - **image_urls**: required list of URLs pointing to damage images.
+    - **bypass_cache**: optional flag to skip the result cache.
     - **case_id**, **case_number**, **created_at**: optional fields echoed back.
     """
 
@@ -54,8 +173,9 @@ async def analyze_batch(req: AnalyzeBatchRequest):
         raise HTTPException(status_code=400, detail="`image_urls` list required")
 
     try:
-        result = batch_inspect(
+        inspection = await batch_inspect(
             image_urls=req.image_urls,
+            bypass_cache=req.bypass_cache,
         )
         logger.info("Batch inspection completed successfully.")
     except Exception as e:
@@ -63,11 +183,105 @@ async def analyze_batch(req: AnalyzeBatchRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-    return {
-        "result": result
-    }
+    return inspection
 
 
+@app.post(
+    "/analyze_batch_stream",
+    summary="Batch-inspect damage images and stream the damages",
+    description="Same input as /analyze_batch. Every damage is sent as soon as Gemini has finished describing it, "
+                "followed by the complete result.",
+    response_description="text/event-stream (or NDJSON) with damage, result and error events"
+)
+async def analyze_batch_stream(
+        req: AnalyzeBatchRequest,
+        format: Literal["sse", "ndjson"] = Query("sse", description="Server-Sent Events or NDJSON lines")
+    ):
+    """
+    Batch-inspect a set of vehicle damage images, streaming the damages as they are found.
+    - **image_urls**: required list of URLs pointing to damage images.
+    - **bypass_cache**: optional flag to skip the result cache.
+    """
+    if not req.image_urls:
+        logger.warning("No image URLs provided.")
+        raise HTTPException(status_code=400, detail="`image_urls` list required")
+
+    def encode(event, data):
+        if format == "ndjson":
+            return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
+        return _sse(event, data)
+
+    async def event_stream():
+        try:
+            async for event, data in stream_batch_inspect(req.image_urls, bypass_cache=req.bypass_cache):
+                yield encode(event, data)
+            logger.info("Streamed batch inspection completed successfully.")
+        except Exception as e:
+            logger.error(f"Error during streamed batch inspection: {str(e)}")
+            yield encode("error", {"error": str(e)})
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+    return StreamingResponse(event_stream(), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post(
+    "/analyze_case",
+    summary="Inspect all photos of a damage case",
+    description="Submit a damage case id; its photos are fetched from the damage case API and inspected for vehicle damage.",
+    response_description="Structured damage data and the photo to coordinate mapping of the case"
+)
+async def analyze_case(req: AnalyzeCaseRequest):
+    """
+    Inspect the photos of a damage case.
+    - **case_id**: required damageCaseId.
+    - **auth_token**: optional bearer token for the case API.
+    - **bypass_cache**: optional flag to skip the result cache.
+    """
+    try:
+        inspection = await case_inspect(req.case_id,
+                                        auth_token=req.auth_token,
+                                        source=req.source,
+                                        bypass_cache=req.bypass_cache)
+        logger.info("Case inspection completed successfully.")
+    except CaseNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except CaseApiError as e:
+        logger.error("%s", e)
+        raise HTTPException(status_code=504 if e.timed_out else 502, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error during case inspection: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return inspection
+
+
+
+async def _enqueue_transcription(file: UploadFile, on_event=None):
+    """
+    Spools the upload to disk and queues it for transcription, returns (guid, queue position)
+    """
+    if not file:
+        logger.warning("No file uploaded.")
+        raise HTTPException(status_code=400, detail="No file provided")
+
+    if not file.content_type.startswith("audio/"):
+        logger.warning("Invalid file type: %s", file.content_type)
+        raise HTTPException(status_code=400, detail="Please upload a valid audio file.")
+
+    guid = str(uuid.uuid4())
+    audio_path = await spool_upload_to_disk(file, MAX_AUDIO_UPLOAD_BYTES)
+
+    try:
+        position = TRANSCRIPTION_SCHEDULER.submit(guid, audio_path, on_event=on_event)
+    except QueueFullError as e:
+        os.remove(audio_path)
+        logger.warning("Transcription queue is full, rejecting upload.")
+        raise HTTPException(status_code=429,
+                            detail="Transcription queue is full, please retry later.",
+                            headers={"Retry-After": str(e.retry_after)})
+    return guid, position
+
 
 @app.post(
     "/transcribe",
@@ -85,41 +299,75 @@ async def transcribe_audio(
     Transcribe an uploaded audio file into text.
     - **file**: audio file to be transcribed.
     """
-    if not file:
-        logger.warning("No file uploaded.")
-        raise HTTPException(status_code=400, detail="No file provided")
+    guid, position = await _enqueue_transcription(file)
+    return {"guid": guid, "queue_position": position}
 
-    if not file.content_type.startswith("audio/"):
-        logger.warning("Invalid file type: %s", file.content_type)
-        raise HTTPException(status_code=400, detail="Please upload a valid audio file.")
 
-    guid = str(uuid.uuid4())
-    TRANSCRIPTION_DATA[guid] = None
+@app.post(
+    "/transcribe_stream",
+    summary="Transcribe an audio file and stream the segments",
+    description="Upload an audio file and receive Server-Sent Events: each transcribed segment "
+                "as soon as it is decoded, followed by the extracted report fields.",
+    response_description="text/event-stream with queued, running, segment, result and error events"
+)
+async def transcribe_audio_stream(
+    file: UploadFile = File(
+        ...,
+        description="The audio file to transcribe (supported formats: MP3, WAV, etc.)"
+    )
+):
+    """
+    Transcribe an uploaded audio file, streaming segments as Server-Sent Events.
+    - **file**: audio file to be transcribed.
+    The job is also stored under the returned guid, so /get_transcription works after a disconnect.
+    """
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
 
-    try:
-        contents = await file.read()
-        file_stream = BytesIO(contents)
+    def on_event(name, data):
+        # called from the transcription worker thread
+        loop.call_soon_threadsafe(events.put_nowait, (name, data))
 
-        thread = threading.Thread(target=analyse_audio, args=(file_stream, guid))
-        thread.start()
+    guid, position = await _enqueue_transcription(file, on_event=on_event)
 
-        return {"guid": guid}
+    async def event_stream():
+        yield _sse("queued", {"guid": guid, "queue_position": position})
+        while True:
+            try:
+                name, data = await asyncio.wait_for(events.get(), timeout=15)
+            except asyncio.TimeoutError:
+                # keeps proxies from closing an idle connection while the job waits in the queue
+                yield ": keep-alive\n\n"
+                continue
+            yield _sse(name, data)
+            if name in ("result", "error"):
+                return
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    except Exception as e:
-        logger.error(f"Error during transcription: {str(e)}")
 
 @app.get("/get_transcription")
 async def get_transcription(guid: str):
-    if guid not in TRANSCRIPTION_DATA:
+    # results stay available until the job store TTL expires them
+    job = TRANSCRIPTION_STORE.get(guid)
+    if job is None:
         return {"output": "Transcription doesn't exist"}
 
-    result = TRANSCRIPTION_DATA[guid]
-    if result is None:
-        return {"output": "Transcription is not yet ready"}
+    if job["status"] == "queued":
+        return {"output": "Transcription is not yet ready",
+                "status": "queued",
+                "queue_position": TRANSCRIPTION_STORE.queue_position(guid)}
+    if job["status"] == "running":
+        return {"output": "Transcription is not yet ready", "status": "running"}
 
-    # Optional: remove to free memory
-    del TRANSCRIPTION_DATA[guid]
-    return {"output": result}
+    if job["status"] == "failed":
+        return {"output": "Transcription failed", "status": "failed", "error": job["error"]}
+    return {"output": job["result"]}
 
 
 @app.post("/analyze_report",
@@ -132,6 +380,11 @@ async def analyze_report(
         document_type: Optional[Literal["general", "eu_report"]] = Form(
             None,
             description="Type of document: must be 'general' or 'eu_report'"
+        ),
+        pages: Optional[str] = Form(
+            None,
+            description="PDF pages to analyze, 1-based, e.g. '1-3,5'. All relevant pages by default. "
+                        "Not allowed for images."
         )
     ):
 
@@ -139,31 +392,134 @@ async def analyze_report(
         logger.warning("No file uploaded.")
         raise HTTPException(status_code=400, detail="No file provided")
 
-    filename = file.filename.lower()
-
-    if filename.endswith(".pdf"):
-        input_type = "pdf"
-    elif filename.endswith((".png", ".jpg", ".jpeg", '.webp')):
-        input_type = "image"
-    else:
+    input_type = report_input_type(file.filename)
+    if input_type is None:
         raise HTTPException(status_code=400, detail="Unsupported file type. Supported file types: PDF, JPEG, PNG.")
 
-    # Read file content
-    contents = await file.read()
-    file_stream = BytesIO(contents)
+    # the upload is already spooled by the multipart parser, read it in place instead of copying
+    check_upload_size(file, MAX_REPORT_UPLOAD_BYTES)
+    await file.seek(0)
 
     try:
-        result = analyse_document(input=file_stream,
-                                  input_type=input_type,
-                                  document_type=document_type)
+        result = await analyse_document(input=file.file,
+                                        input_type=input_type,
+                                        document_type=document_type,
+                                        pages=pages)
         logger.info("Document analysis completed successfully.")
 
         return JSONResponse(content=result)
+    except asyncio.TimeoutError:
+        logger.error("Report analysis exceeded the OCR deadline.")
+        raise HTTPException(status_code=504, detail="Document analysis timed out.")
+    except PageRangeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error("Error during report analysis: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _spool_report_batch(files: List[UploadFile],
+                              document_type: Optional[str],
+                              overrides: dict) -> List[dict]:
+    """
+    Spools the uploaded reports (and the contents of zip archives) to disk, one item per report.
+    Items that cannot be processed carry an error instead of a path.
+    """
+    items = []
+    # extracted archive entries not yet turned into items
+    pending = []
+
+    def add_item(filename, path, error=None):
+        item_type = overrides.get(filename, overrides.get(os.path.basename(filename), document_type))
+        if error is None and report_input_type(filename) is None:
+            error = "Unsupported file type. Supported file types: PDF, JPEG, PNG, WEBP."
+        if error is None and item_type is not None and item_type not in OUTPUT_FORMS:
+            error = f"{item_type} is an invalid document type. Please choose 'general' or 'eu_report'."
+        if error is not None and path is not None:
+            os.remove(path)
+            path = None
+        items.append({"filename": filename, "path": path, "document_type": item_type, "error": error})
+        if len(items) > REPORT_BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"A batch holds at most {REPORT_BATCH_MAX_ITEMS} reports.")
+
+    try:
+        for file in files:
+            if file.filename.lower().endswith(".zip"):
+                archive_path = await spool_upload_to_disk(file, MAX_REPORT_BATCH_BYTES)
+                try:
+                    entries = await asyncio.to_thread(extract_zip_to_disk, archive_path,
+                                                      MAX_REPORT_UPLOAD_BYTES, MAX_REPORT_BATCH_BYTES)
+                except zipfile.BadZipFile:
+                    add_item(file.filename, None, "Not a valid zip archive.")
+                    continue
+                finally:
+                    os.remove(archive_path)
+                pending = [path for _, path, _ in entries if path is not None]
+                for name, path, error in entries:
+                    add_item(name, path, error)
+                    if path is not None:
+                        pending.remove(path)
+            else:
+                try:
+                    path = await spool_upload_to_disk(file, MAX_REPORT_UPLOAD_BYTES)
+                except HTTPException as e:
+                    if e.status_code != 413:
+                        raise
+                    add_item(file.filename, None, e.detail)
+                    continue
+                add_item(file.filename, path)
+    except BaseException:
+        for path in pending + [item["path"] for item in items]:
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+        raise
+    return items
+
+
+@app.post("/analyze_report_batch",
+        summary="Analyze many traffic accident reports in one request",
+        description="Upload report files (PDF, JPEG, PNG, WEBP) and/or zip archives of them. "
+                    "Each report is analyzed as soon as capacity allows and its result is streamed back "
+                    "as one NDJSON line, in completion order.",
+        response_description="application/x-ndjson with one line per report: index, filename, status and result or error"
+)
+async def analyze_report_batch(
+        files: List[UploadFile] = File(..., description="Report files and/or zip archives of report files"),
+        document_type: Optional[Literal["general", "eu_report"]] = Form(
+            None,
+            description="Default type of all documents: 'general' or 'eu_report'"
+        ),
+        document_types: Optional[str] = Form(
+            None,
+            description='JSON object with per-file document types, e.g. {"report1.pdf": "eu_report"}'
+        )
+    ):
+    try:
+        overrides = json.loads(document_types) if document_types else {}
+    except json.JSONDecodeError:
+        overrides = None
+    if not isinstance(overrides, dict):
+        raise HTTPException(status_code=400, detail="document_types must be a JSON object of file name to type.")
+
+    # the uploads are closed once this handler returns, so everything is spooled before streaming starts
+    items = await _spool_report_batch(files, document_type, overrides)
+    logger.info("Report batch of %d item(s) accepted.", len(items))
+
+    async def stream():
+        batch = iter_report_batch(items)
+        try:
+            async for entry in batch:
+                yield json.dumps(entry, ensure_ascii=False) + "\n"
+        finally:
+            # stops the remaining items if the client disconnected
+            await batch.aclose()
+            for item in items:
+                if item["path"] is not None and os.path.exists(item["path"]):
+                    os.remove(item["path"])
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8080)
\ No newline at end of file
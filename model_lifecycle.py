@@ -0,0 +1,195 @@
+import gc
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from konfiguracija import MODEL_IDLE_CHECK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# load on first use and keep
+LAZY = "lazy"
+# load and warm up at startup
+EAGER = "eager"
+# load on first use, unload after a quiet period
+IDLE_UNLOAD = "idle_unload"
+
+POLICIES = (LAZY, EAGER, IDLE_UNLOAD)
+
+
+class ManagedResource:
+    """
+    A model or client whose loading and unloading follows a lifecycle policy.
+    Callers obtain it with `with resource.use() as obj:` so that it is never
+    unloaded while in use.
+    """
+
+    def __init__(self,
+                 name: str,
+                 loader: Callable[[], Any],
+                 policy: str = LAZY,
+                 idle_timeout: float = 600.0,
+                 warmup: Optional[Callable[[Any], None]] = None,
+                 unloader: Optional[Callable[[Any], None]] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"{policy} is an invalid lifecycle policy. Please choose one of {POLICIES}.")
+        self.name = name
+        self.loader = loader
+        self.policy = policy
+        self.idle_timeout = idle_timeout
+        self.warmup = warmup
+        self.unloader = unloader
+
+        self._obj: Any = None
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self.state = "unloaded"
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.last_used: Optional[float] = None
+
+    def _load(self):
+        self.state = "loading"
+        started = time.monotonic()
+        try:
+            obj = self.loader()
+            if self.warmup is not None and self.policy == EAGER:
+                self.warmup(obj)
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            raise
+        self._obj = obj
+        self.load_seconds = time.monotonic() - started
+        self.state = "loaded"
+        self.error = None
+        logger.info("Loaded %s in %.1fs (policy=%s).", self.name, self.load_seconds, self.policy)
+
+    def get(self) -> Any:
+        """
+        Returns the loaded object, loading it first if needed
+        """
+        with self._lock:
+            if self._obj is None:
+                self._load()
+            self.last_used = time.monotonic()
+            return self._obj
+
+    @contextmanager
+    def use(self) -> Iterator[Any]:
+        with self._lock:
+            if self._obj is None:
+                self._load()
+            self._in_use += 1
+            obj = self._obj
+        try:
+            yield obj
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                self.last_used = time.monotonic()
+
+    def start(self):
+        if self.policy == EAGER:
+            self.get()
+
+    def unload(self):
+        with self._lock:
+            self._unload()
+
+    def _unload(self):
+        if self._obj is None:
+            return
+        if self.unloader is not None:
+            self.unloader(self._obj)
+        self._obj = None
+        self.state = "unloaded"
+        gc.collect()
+        logger.info("Unloaded %s.", self.name)
+
+    def unload_if_idle(self):
+        if self.policy != IDLE_UNLOAD:
+            return
+        with self._lock:
+            if self._obj is None or self._in_use or self.last_used is None:
+                return
+            if time.monotonic() - self.last_used >= self.idle_timeout:
+                self._unload()
+
+    def status(self) -> Dict[str, Any]:
+        idle = time.monotonic() - self.last_used if self.last_used is not None else None
+        return {
+            "state": self.state,
+            "policy": self.policy,
+            "in_use": self._in_use,
+            "load_seconds": self.load_seconds,
+            "idle_seconds": idle,
+            "error": self.error,
+        }
+
+
+class LifecycleManager:
+    """
+    Loads eager resources in the background and periodically unloads idle ones
+    """
+
+    def __init__(self, check_interval: float = 30.0):
+        self.check_interval = check_interval
+        self.resources: List[ManagedResource] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loader: Optional[threading.Thread] = None
+
+    def register(self, resource: ManagedResource) -> ManagedResource:
+        self.resources.append(resource)
+        return resource
+
+    def start(self):
+        """
+        Returns immediately; /ready reports the eager resources as they load, or why they failed
+        """
+        self._stop.clear()
+        self._loader = threading.Thread(target=self._load_eager, name="model-eager-loader", daemon=True)
+        self._loader.start()
+        self._thread = threading.Thread(target=self._reaper, name="model-idle-reaper", daemon=True)
+        self._thread.start()
+
+    def _load_eager(self):
+        for resource in self.resources:
+            if self._stop.is_set():
+                return
+            try:
+                resource.start()
+            except Exception:
+                # the error is kept in the resource status
+                logger.exception("Failed to load %s.", resource.name)
+
+    def stop(self):
+        self._stop.set()
+        for thread in (self._loader, self._thread):
+            if thread is not None:
+                thread.join(timeout=5)
+        for resource in self.resources:
+            resource.unload()
+
+    def _reaper(self):
+        while not self._stop.wait(self.check_interval):
+            for resource in self.resources:
+                try:
+                    resource.unload_if_idle()
+                except Exception:
+                    logger.exception("Failed to unload idle resource %s.", resource.name)
+
+    def ready(self) -> bool:
+        """
+        Ready once every eager resource is loaded
+        """
+        return all(r.state == "loaded" for r in self.resources if r.policy == EAGER)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {resource.name: resource.status() for resource in self.resources}
+
+
+LIFECYCLE = LifecycleManager(check_interval=MODEL_IDLE_CHECK_INTERVAL)
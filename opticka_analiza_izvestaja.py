@@ -1,51 +1,62 @@
 from PIL import Image
 from io import BytesIO
+import asyncio
+import copy
+import hashlib
 import json
 import ast
 import logging
-
-from konfiguracija import get_document_intel_object, get_openai_credentials
-from faster_whisper import WhisperModel
-
-from transcriptions_store import TRANSCRIPTION_DATA
-
-OUTPUT_FILE_MAPPING = {
-    'general': 'generalna_forma_izlaza.json',
-    'eu_report': 'eu_izvestaj_forma_izlaze.json'
-}
-
-WHISPER_MODEL_NAME = "large-v3-turbo"
-TRANSCRIPTION_MODEL = WhisperModel(WHISPER_MODEL_NAME)
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from azure.ai.documentintelligence.models import AnalyzeResult
+
+from cache_store import DiskCache, TTLCache, SingleFlight, AsyncSingleFlight
+from konfiguracija import (
+    OCR_MODEL_ID,
+    OCR_POLLING_INTERVAL,
+    OCR_DEADLINE_SECONDS,
+    OCR_CACHE_ENABLED,
+    OCR_CACHE_PATH,
+    OCR_CACHE_MAX_BYTES,
+    OCR_MAX_CONCURRENCY,
+    PDF_PAGES_PER_CHUNK,
+    PDF_OCR_CONCURRENCY,
+    PDF_PAGE_FILTER_ENABLED,
+    PDF_PAGE_MIN_SIGNALS,
+    PDF_TEXT_LAYER_ENABLED,
+    PDF_TEXT_LAYER_MIN_CHARS,
+    PDF_TEXT_LAYER_MIN_SCORE,
+    LLM_CACHE_TTL,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_MAX_CONCURRENCY,
+    REPORT_BATCH_CONCURRENCY,
+    get_async_document_intel_object,
+    get_openai_credentials,
+    get_async_openai_credentials,
+)
+from promptovi import get_extraction_prompt
+from transkripcija import iter_segments
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
                     handlers=[logging.StreamHandler()])
 logger = logging.getLogger(__name__)
 
-def get_output_form(document_type):
-    """
-    Get the output form from the document type
-    """
-    # if document_type is not specified
-    if document_type is None:
-        document_type = 'general'
+# OCR results keyed by SHA-256 of the uploaded bytes and the model id,
+# so re-running a document with another document_type skips OCR
+OCR_CACHE = DiskCache(OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES) if OCR_CACHE_ENABLED else None
 
-    # chose the file path from the dictionary
-    if document_type not in OUTPUT_FILE_MAPPING.keys():
-        raise ValueError(f"{document_type} is an invalid document type. Please choose 'general' or 'eu_report'.")
+LLM_CACHE = TTLCache(max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL)
+# identical extractions in flight at the same time share one upstream call
+LLM_SINGLEFLIGHT = SingleFlight()
+LLM_ASYNC_SINGLEFLIGHT = AsyncSingleFlight()
 
-    # Load and pass the file
-    with open(OUTPUT_FILE_MAPPING[document_type], 'rb') as f:
-        output_form = json.load(f)
-    return output_form
+# caps on concurrent upstream calls, shared by every request in this process
+OCR_LIMIT = asyncio.Semaphore(OCR_MAX_CONCURRENCY)
+LLM_LIMIT = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
 
-def extract_info_from_image(file_input,
-                            max_size=1000):
-    """
-    Extract information from an image using Azure Document Intelligence
-    Resize image if needed.
-    """
-    client = get_document_intel_object()
+def _resize_image(file_input, max_size):
     img = Image.open(file_input)
 
     w, h = img.size
@@ -55,61 +66,222 @@ def extract_info_from_image(file_input,
     stream = BytesIO()
     img.save(stream, format="PNG")
     stream.seek(0)
+    return stream
 
-    poller = client.begin_analyze_document(
-        model_id="prebuilt-layout",
-        body=stream,
-        content_type="image/png"
-    )
-    return poller.result()
+def _hash_file(file_input, *extra):
+    """
+    SHA-256 of a file handle's content (read in chunks) plus any extra key parts
+    """
+    digest = hashlib.sha256()
+    file_input.seek(0)
+    for chunk in iter(lambda: file_input.read(1024 * 1024), b""):
+        digest.update(chunk)
+    file_input.seek(0)
+    for part in extra:
+        digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+async def _analyze_layout(body, content_type, cache_key=None):
+    """
+    Runs the layout model with the async client. Waiting for the result is bounded by the
+    OCR deadline; analyse_document bounds the whole OCR stage by it as well.
+    Results are cached by cache_key when the OCR cache is enabled.
+    """
+    if OCR_CACHE is not None and cache_key is not None:
+        cached = await asyncio.to_thread(OCR_CACHE.get, cache_key)
+        if cached is not None:
+            logger.info("OCR result served from the cache.")
+            return AnalyzeResult(cached)
+
+    client = get_async_document_intel_object()
+    async with OCR_LIMIT:
+        poller = await client.begin_analyze_document(
+            model_id=OCR_MODEL_ID,
+            body=body,
+            content_type=content_type,
+            polling_interval=OCR_POLLING_INTERVAL
+        )
+        result = await asyncio.wait_for(poller.result(), timeout=OCR_DEADLINE_SECONDS)
+
+    if OCR_CACHE is not None and cache_key is not None:
+        await asyncio.to_thread(OCR_CACHE.set, cache_key, result.as_dict())
+    return result
+
+async def extract_info_from_image(file_input,
+                                  max_size=1000):
+    """
+    Extract information from an image using Azure Document Intelligence
+    Resize image if needed.
+    """
+    # hashing and Pillow work happen off the event loop
+    cache_key = await asyncio.to_thread(_hash_file, file_input, OCR_MODEL_ID, max_size)
+    stream = await asyncio.to_thread(_resize_image, file_input, max_size)
+    return await _analyze_layout(stream, "image/png", cache_key)
 
-def extract_info_from_pdf(file_input):
+class PageRangeError(ValueError):
     """
-    Extracts information from a PDF file using Azure Document Intelligence
+    Raised for a page selection that does not fit the document
     """
-    client = get_document_intel_object()
-    poller = client.begin_analyze_document(
-        model_id="prebuilt-layout",
-        body=file_input,
-        content_type="application/pdf"
-    )
-    return poller.result()
 
-def process_raw_output(ocr_json: str,
-                       document_type: str = 'general') -> str:
+def parse_page_ranges(spec: Optional[str], page_count: int) -> List[int]:
     """
-    Feeds the raw OCR JSON (ocr_json) into the model with a strict system prompt,
-    and returns the assistant’s raw text response (your flat JSON).
+    Turns a 1-based page selection such as "1-3,5" into sorted 0-based page indices.
+    No selection means all pages.
+    """
+    if not spec:
+        return list(range(page_count))
+
+    pages = set()
+    for part in spec.split(','):
+        part = part.strip()
+        match = re.fullmatch(r"(\d+)(?:\s*-\s*(\d+))?", part)
+        if match is None:
+            raise PageRangeError(f"{part} is an invalid page range. Use e.g. '1-3,5'.")
+        first = int(match.group(1))
+        last = int(match.group(2) or first)
+        if first < 1 or last < first or last > page_count:
+            raise PageRangeError(f"Page range {part} is outside of the document's {page_count} page(s).")
+        pages.update(range(first - 1, last))
+    return sorted(pages)
+
+def text_layer_score(text: str, min_chars: int = PDF_TEXT_LAYER_MIN_CHARS) -> float:
     """
+    Share of readable characters in an embedded text layer, 0 if there is too little text.
+    Undecodable glyphs ((cid:NN), U+FFFD, control characters) count against it.
+    """
+    stripped = text.strip()
+    if len(stripped) < min_chars:
+        return 0.0
+    garbage = len(re.findall(r"\(cid:\d+\)", stripped)) * 8
+    garbage += sum(1 for c in stripped if c == "\ufffd" or (not c.isprintable() and not c.isspace()))
+    return max(0.0, 1 - garbage / len(stripped))
+
+def _route_pdf_pages(file_input,
+                     pages: Optional[str],
+                     pages_per_chunk: int) -> Tuple[List[Tuple[int, str]], List[Tuple[List[int], bytes]]]:
+    """
+    Reads the text layer of the selected pages of a PDF.
+    Returns the (0-based index, text) pairs of pages with a usable text layer and
+    (0-based page indices, PDF bytes) chunks of the pages that still need OCR.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    file_input.seek(0)
+    reader = PdfReader(file_input)
+    selected = parse_page_ranges(pages, len(reader.pages))
+
+    local_pages = []
+    scanned = []
+    for index in selected:
+        text = ""
+        if PDF_TEXT_LAYER_ENABLED:
+            try:
+                text = reader.pages[index].extract_text() or ""
+            except Exception as e:  # a broken content stream just means OCR
+                logger.warning("Could not read the text layer of page %d: %s", index + 1, e)
+        if PDF_TEXT_LAYER_ENABLED and text_layer_score(text) >= PDF_TEXT_LAYER_MIN_SCORE:
+            local_pages.append((index, text))
+        else:
+            scanned.append(index)
+
+    chunks = []
+    for start in range(0, len(scanned), pages_per_chunk):
+        chunk_pages = scanned[start:start + pages_per_chunk]
+        writer = PdfWriter()
+        for index in chunk_pages:
+            writer.add_page(reader.pages[index])
+        stream = BytesIO()
+        writer.write(stream)
+        chunks.append((chunk_pages, stream.getvalue()))
+    file_input.seek(0)
+    return local_pages, chunks
+
+def _page_texts(result) -> List[str]:
+    """
+    Text of every page of a layout result, in page order
+    """
+    texts = []
+    for page in result.pages or []:
+        texts.append("".join(result.content[span.offset:span.offset + span.length]
+                             for span in page.spans or []))
+    return texts
 
-    model, client = get_openai_credentials()
-    format_izlaza = get_output_form(document_type)
-
-    system_prompt = (
-        "You are a highly accurate data-extraction tool. "
-        "Given the full OCR output from a document, "
-        "return ONLY a single, valid JSON object by filling in the values"
-        "You will likely be given a text in English or Serbian"
-        "Correct some obvious mistakes if esitmate that they are made"
-        "but do not write anything else"
-        f"here is the format of the output: {format_izlaza}"
-    )
-
-    user_prompt = f"**INPUT**\n{ocr_json}"
-
-    messages = [
-        {"role": "system",  "content": system_prompt},
-        {"role": "user",    "content": user_prompt}
-    ]
+async def extract_pages_from_pdf(file_input, pages: Optional[str] = None) -> List[Tuple[int, str]]:
+    """
+    Returns (1-based page number, text) pairs for the selected pages of a PDF.
+    Pages with a complete embedded text layer are read locally; the rest are OCR'd
+    in concurrent chunks. Every chunk is cached on its own, so another page selection
+    reuses the chunks already seen.
+    """
+    document_hash = await asyncio.to_thread(_hash_file, file_input, OCR_MODEL_ID)
+    local_pages, chunks = await asyncio.to_thread(_route_pdf_pages, file_input, pages, PDF_PAGES_PER_CHUNK)
+    limit = asyncio.Semaphore(PDF_OCR_CONCURRENCY)
+
+    async def ocr_chunk(chunk_pages, body):
+        cache_key = f"{document_hash}:{','.join(str(i) for i in chunk_pages)}"
+        async with limit:
+            result = await _analyze_layout(BytesIO(body), "application/pdf", cache_key)
+        return list(zip((i + 1 for i in chunk_pages), _page_texts(result)))
+
+    results = await asyncio.gather(*(ocr_chunk(chunk_pages, body) for chunk_pages, body in chunks))
+    logger.info("Read %d page(s) from the text layer, OCR'd %d page(s) in %d chunk(s).",
+                len(local_pages), sum(len(c) for c, _ in chunks), len(chunks))
+
+    page_texts = [(index + 1, text) for index, text in local_pages]
+    page_texts.extend(page for chunk in results for page in chunk)
+    return sorted(page_texts)
+
+# signals that a page holds report fields rather than boilerplate
+_PAGE_SIGNALS = {
+    "plate": re.compile(r"\b[A-ZČĆŠĐŽ]{1,3}[- ]?\d{2,5}[- ]?[A-ZČĆŠĐŽ]{1,3}\b"),
+    "date": re.compile(r"\b\d{1,2}[./-]\s?\d{1,2}[./-]\s?\d{2,4}\b"),
+    "party": re.compile(
+        r"u[čc]esnik|voza[čc]|vlasnik|osigura|polis|registarsk|svedo|"
+        r"driver|owner|insur|policy|registration|witness|vehicle [ab]\b",
+        re.IGNORECASE),
+}
+
+def page_signals(text: str) -> List[str]:
+    """
+    Kinds of report fields found on a page
+    """
+    return [name for name, pattern in _PAGE_SIGNALS.items() if pattern.search(text)]
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=0.0,
-    )
+def select_relevant_pages(page_texts: List[Tuple[int, str]],
+                          min_signals: int = PDF_PAGE_MIN_SIGNALS) -> List[Tuple[int, str]]:
+    """
+    Keeps the first page and every page with at least min_signals kinds of report fields.
+    Falls back to all pages if the filter would leave nothing but the first one.
+    """
+    selected = [(number, text) for i, (number, text) in enumerate(page_texts)
+                if i == 0 or len(page_signals(text)) >= min_signals]
+    if len(selected) <= 1 < len(page_texts):
+        return page_texts
+    return selected
 
-    raw = response.choices[0].message.content.strip()
+def _llm_cache_key(ocr_json, document_type, model):
+    """
+    Extraction runs at temperature 0, so the same text, model and prompt give the same answer.
+    The prompt tag covers the output form, which is part of the prompt prefix.
+    """
+    digest = hashlib.sha256()
+    for part in (ocr_json,
+                 get_extraction_prompt(document_type).tag,
+                 model):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+def _build_messages(ocr_json, document_type):
+    prompt = get_extraction_prompt(document_type)
+
+    # the system message is the cached static prefix, the OCR text always comes last
+    return [
+        {"role": "system",  "content": prompt.prefix},
+        {"role": "user",    "content": prompt.render_suffix(ocr_json=ocr_json)}
+    ]
 
+def _parse_llm_output(raw):
     # Strip Markdown formatting if present
     clean_response = raw.replace("```json", "").replace("```", "").strip()
 
@@ -124,31 +296,155 @@ def process_raw_output(ocr_json: str,
             raise ValueError(
                 f"Failed to parse LLM output.\nRaw output:\n{raw}\n\nJSON error: {e}\nLiteral eval error: {fallback_error}")
 
-def analyse_document(input,
-                     input_type='image',
-                     document_type='general'):
+def process_raw_output(ocr_json: str,
+                       document_type: str = 'general') -> str:
     """
-    Performs document analysis and returns the output
+    Feeds the raw OCR JSON (ocr_json) into the model with a strict system prompt,
+    and returns the assistant’s raw text response (your flat JSON).
+    Blocking variant, used from the transcription worker threads.
+    """
+
+    model, client = get_openai_credentials()
+    cache_key = _llm_cache_key(ocr_json, document_type, model)
+    cached = LLM_CACHE.get(cache_key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    def call():
+        response = client.chat.completions.create(
+            model=model,
+            messages=_build_messages(ocr_json, document_type),
+            temperature=0.0,
+        )
+
+        raw = response.choices[0].message.content.strip()
+        result = _parse_llm_output(raw)
+        LLM_CACHE.set(cache_key, result)
+        return result
+
+    # callers get their own copy, the cached result must stay untouched
+    return copy.deepcopy(LLM_SINGLEFLIGHT.do(cache_key, call))
+
+async def aprocess_raw_output(ocr_json: str,
+                              document_type: str = 'general') -> str:
+    """
+    Non-blocking variant of process_raw_output, used by the report pipeline
+    """
+
+    model, client = get_async_openai_credentials()
+    cache_key = _llm_cache_key(ocr_json, document_type, model)
+    cached = LLM_CACHE.get(cache_key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    async def call():
+        async with LLM_LIMIT:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=_build_messages(ocr_json, document_type),
+                temperature=0.0,
+            )
+
+        raw = response.choices[0].message.content.strip()
+        result = _parse_llm_output(raw)
+        LLM_CACHE.set(cache_key, result)
+        return result
+
+    return copy.deepcopy(await LLM_ASYNC_SINGLEFLIGHT.do(cache_key, call))
+
+async def analyse_document(input,
+                           input_type='image',
+                           document_type='general',
+                           pages=None):
+    """
+    Performs document analysis and returns the output.
+    For PDFs, pages selects a 1-based page range such as "1-3,5"; explicitly selected pages
+    all go to the LLM, without the relevance filter. Images have no pages to select.
     """
     if input_type == 'image':
-        document_intelligence_output = extract_info_from_image(input)
+        if pages:
+            raise PageRangeError("A page selection is only supported for PDF documents.")
+        async with asyncio.timeout(OCR_DEADLINE_SECONDS):
+            document_intelligence_output = await extract_info_from_image(input)
+        text = document_intelligence_output.content
     elif input_type == 'pdf':
-        document_intelligence_output = extract_info_from_pdf(input)
+        # one deadline for the whole OCR stage, including the wait for a free OCR slot and every chunk
+        async with asyncio.timeout(OCR_DEADLINE_SECONDS):
+            page_texts = await extract_pages_from_pdf(input, pages)
+        if PDF_PAGE_FILTER_ENABLED and not pages:
+            relevant = select_relevant_pages(page_texts)
+            logger.info("Forwarding %d of %d page(s) to the LLM.", len(relevant), len(page_texts))
+            page_texts = relevant
+        text = "\n\n".join(page_text for _, page_text in page_texts)
     else:
         raise ValueError("Invalid input type. Please choose 'image' or 'pdf'.")
 
-    processed_output = process_raw_output(document_intelligence_output.content,
-                                          document_type=document_type)
+    processed_output = await aprocess_raw_output(text, document_type=document_type)
 
     return processed_output
 
-def analyse_audio(input, guid):
-    logger.info("Transcription started")
+def report_input_type(filename: str) -> Optional[str]:
+    """
+    'pdf' or 'image' depending on the file extension, None for unsupported files
+    """
+    filename = filename.lower()
+    if filename.endswith(".pdf"):
+        return "pdf"
+    if filename.endswith((".png", ".jpg", ".jpeg", ".webp")):
+        return "image"
+    return None
+
+async def iter_report_batch(items: List[Dict[str, Any]],
+                            concurrency: int = REPORT_BATCH_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Analyses spooled report files concurrently and yields one entry per item as soon as it is done.
+    Items are dicts with filename, path and document_type; an item with an error key is reported as is.
+    A failing item yields an error entry instead of stopping the batch.
+    """
+    limit = asyncio.Semaphore(concurrency)
 
-    segments, _ = TRANSCRIPTION_MODEL.transcribe(input)
-    logger.info(f"Transcription generator created.")
+    async def analyse_item(index, item):
+        entry = {"index": index, "filename": item["filename"], "document_type": item.get("document_type")}
+        if item.get("error"):
+            entry.update(status="error", error=item["error"])
+            return entry
+        try:
+            async with limit:
+                with open(item["path"], "rb") as f:
+                    entry["result"] = await analyse_document(f,
+                                                             input_type=report_input_type(item["filename"]),
+                                                             document_type=item.get("document_type"))
+            entry["status"] = "ok"
+        except asyncio.TimeoutError:
+            entry.update(status="error", error="Document analysis timed out.")
+        except Exception as e:
+            logger.error("Batch item %s failed: %s", item["filename"], str(e))
+            entry.update(status="error", error=str(e))
+        return entry
+
+    tasks = [asyncio.ensure_future(analyse_item(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # the client went away or the batch is done; nothing may keep running on the spooled files
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def analyse_audio(input, on_event=None):
+    """
+    Transcribes the audio and extracts the report fields from the transcript.
+    If on_event is given, every decoded segment is reported as ("segment", {...}) right away.
+    """
+    logger.info("Transcription started")
 
-    transcript = "".join(s.text for s in segments)
+    texts = []
+    for segment in iter_segments(input):
+        texts.append(segment.text)
+        if on_event is not None:
+            on_event("segment", {"start": segment.start, "end": segment.end, "text": segment.text})
+    transcript = "".join(texts)
     logger.info("Transcript assembled successfully.")
 
     # extract information from transcript
@@ -157,7 +453,7 @@ def analyse_audio(input, guid):
 
     extracted_output['transcript'] = transcript
 
-    TRANSCRIPTION_DATA[guid] = extracted_output
+    return extracted_output
 
 
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from konfiguracija import (
+    IMAGE_DOWNLOAD_TIMEOUT,
+    IMAGE_BATCH_DEADLINE,
+    IMAGE_DOWNLOAD_PER_HOST,
+    IMAGE_DOWNLOAD_MAX_CONNECTIONS,
+    IMAGE_DOWNLOAD_KEEPALIVE,
+    IMAGE_CACHE_ENABLED,
+    IMAGE_CACHE_DIR,
+    IMAGE_CACHE_MAX_BYTES,
+)
+from image_cache import ImageCache
+
+logger = logging.getLogger(__name__)
+
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+_HOST_LIMITS: Dict[str, asyncio.Semaphore] = {}
+
+IMAGE_CACHE = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES) if IMAGE_CACHE_ENABLED else None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared keep-alive client used for all image downloads
+    """
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            timeout=httpx.Timeout(IMAGE_DOWNLOAD_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=IMAGE_DOWNLOAD_MAX_CONNECTIONS,
+                max_keepalive_connections=IMAGE_DOWNLOAD_MAX_CONNECTIONS,
+                keepalive_expiry=IMAGE_DOWNLOAD_KEEPALIVE,
+            ),
+            follow_redirects=True,
+        )
+    return _HTTP_CLIENT
+
+
+async def close_http_client():
+    """
+    Closes the shared download client (called on app shutdown)
+    """
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+        _HTTP_CLIENT = None
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    if host not in _HOST_LIMITS:
+        _HOST_LIMITS[host] = asyncio.Semaphore(IMAGE_DOWNLOAD_PER_HOST)
+    return _HOST_LIMITS[host]
+
+
+async def download_image(url: str) -> bytes:
+    """
+    Downloads a single image, respecting the per-host concurrency limit.
+    Cached images are revalidated with ETag/Last-Modified and served from disk on 304.
+    """
+    client = get_http_client()
+    entry = None
+    if IMAGE_CACHE is not None:
+        entry = await asyncio.to_thread(IMAGE_CACHE.lookup, url)
+
+    async with _host_limit(url):
+        resp = await client.get(url, headers=IMAGE_CACHE.validation_headers(entry) if entry else None)
+
+    if resp.status_code == 304 and entry is not None:
+        blob = await asyncio.to_thread(IMAGE_CACHE.read, entry["sha256"])
+        if blob is not None:
+            return blob
+        # blob vanished from disk in the meantime, fetch it unconditionally
+        async with _host_limit(url):
+            resp = await client.get(url)
+
+    resp.raise_for_status()
+    blob = resp.content
+    if IMAGE_CACHE is not None:
+        await asyncio.to_thread(IMAGE_CACHE.store, url, blob,
+                                resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+    return blob
+
+
+async def collect_downloads(image_urls: List[str],
+                            tasks: List["asyncio.Task"],
+                            deadline: float) -> List[Optional[bytes]]:
+    """
+    Waits up to deadline seconds for already started download tasks and returns their contents
+    in input order. Failed downloads and downloads still running at the deadline are None.
+    """
+    if not tasks:
+        return []
+
+    done, pending = await asyncio.wait(tasks, timeout=max(deadline, 0))
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning("Image download deadline of %ss exceeded, %d image(s) dropped.", deadline, len(pending))
+
+    blobs: List[Optional[bytes]] = []
+    for url, task in zip(image_urls, tasks):
+        if task not in done:
+            blobs.append(None)
+        elif task.exception() is not None:
+            logger.error("Error downloading image %s: %s", url, task.exception())
+            blobs.append(None)
+        else:
+            blobs.append(task.result())
+    return blobs
+
+
+async def download_images(image_urls: List[str],
+                          deadline: float = IMAGE_BATCH_DEADLINE) -> List[Optional[bytes]]:
+    """
+    Downloads all images concurrently and returns their contents in input order.
+    Failed downloads and downloads still running when the deadline expires are None.
+    """
+    tasks = [asyncio.create_task(download_image(url)) for url in image_urls]
+    return await collect_downloads(image_urls, tasks, deadline)
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from konfiguracija import (
+    IMAGE_PREPROCESS_ENABLED,
+    IMAGE_MAX_LONG_EDGE,
+    IMAGE_JPEG_QUALITY,
+    IMAGE_PREPROCESS_WORKERS,
+    IMAGE_DEDUP_MAX_DISTANCE,
+)
+
+try:
+    # optional HEIC/HEIF decoding support
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=IMAGE_PREPROCESS_WORKERS,
+                               thread_name_prefix="image-preprocess")
+
+# changes whenever the preprocessing output would change, used in cache keys
+PREPROCESS_SIGNATURE = (
+    f"v2;enabled={IMAGE_PREPROCESS_ENABLED};edge={IMAGE_MAX_LONG_EDGE};quality={IMAGE_JPEG_QUALITY}"
+)
+
+# mime types Gemini accepts as image input without conversion
+GEMINI_IMAGE_MIME_TYPES = {"image/jpeg", "image/png", "image/webp", "image/heic", "image/heif"}
+
+
+def detect_mime_type(blob: bytes) -> str:
+    """
+    Detects the image format from its magic bytes
+    """
+    if blob[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if blob[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if blob[:4] == b"RIFF" and blob[8:12] == b"WEBP":
+        return "image/webp"
+    if blob[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if blob[:2] == b"BM":
+        return "image/bmp"
+    if blob[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    if blob[4:8] == b"ftyp":
+        brand = blob[8:12]
+        if brand in (b"heic", b"heix", b"hevc", b"hevx"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1", b"heif"):
+            return "image/heif"
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+    return "application/octet-stream"
+
+
+def normalize_image(blob: bytes,
+                    max_long_edge: int = IMAGE_MAX_LONG_EDGE,
+                    quality: int = IMAGE_JPEG_QUALITY) -> Tuple[bytes, str]:
+    """
+    Applies EXIF orientation, downscales to max_long_edge and re-encodes as JPEG.
+    Returns the (possibly unchanged) bytes together with their real mime type.
+    A max_long_edge of 0 disables downscaling.
+    """
+    mime_type = detect_mime_type(blob)
+    try:
+        img = Image.open(BytesIO(blob))
+        img.load()
+    except Exception as e:
+        # e.g. HEIC without pillow-heif installed: send the original bytes as they are
+        logger.warning("Could not decode %s image for preprocessing: %s", mime_type, e)
+        return blob, mime_type
+
+    # exif_transpose always returns a copy, so the orientation tag decides whether anything turned
+    rotated = img.getexif().get(0x0112, 1) not in (None, 1)
+    if rotated:
+        img = ImageOps.exif_transpose(img)
+
+    w, h = img.size
+    resized = False
+    if max_long_edge and max(w, h) > max_long_edge:
+        factor = max_long_edge / max(w, h)
+        img = img.resize((max(1, int(w * factor)), max(1, int(h * factor))), Image.LANCZOS)
+        resized = True
+
+    if mime_type == "image/jpeg" and not (rotated or resized):
+        # re-encoding an already small JPEG only loses quality
+        return blob, mime_type
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    stream = BytesIO()
+    img.save(stream, format="JPEG", quality=quality, optimize=True)
+    encoded = stream.getvalue()
+
+    if len(encoded) >= len(blob) and mime_type in GEMINI_IMAGE_MIME_TYPES and not rotated:
+        return blob, mime_type
+    return encoded, "image/jpeg"
+
+
+async def normalize_images(blobs: List[bytes]) -> List[Tuple[bytes, str]]:
+    """
+    Normalizes images concurrently in the preprocessing worker pool
+    """
+    if not IMAGE_PREPROCESS_ENABLED:
+        return [(blob, detect_mime_type(blob)) for blob in blobs]
+
+    loop = asyncio.get_running_loop()
+    return list(await asyncio.gather(*[
+        loop.run_in_executor(_EXECUTOR, normalize_image, blob) for blob in blobs
+    ]))
+
+
+# perceptual hash plus the coarse properties the hash is blind to
+ImageSignature = namedtuple("ImageSignature", ["dhash", "colour", "aspect"])
+
+# largest difference of the mean of any colour channel (0-255) between duplicates
+_MAX_COLOUR_DIFFERENCE = 12
+# largest relative difference of the width / height ratio between duplicates
+_MAX_ASPECT_DIFFERENCE = 0.02
+
+
+def image_signature(blob: bytes, size: int = 8) -> Optional[ImageSignature]:
+    """
+    Difference hash of an image: size x size bits, each telling whether a pixel of the
+    downscaled grayscale image is brighter than its right neighbour; together with the
+    mean colour and aspect ratio, which the hash ignores.
+    Survives rescaling and re-encoding; None if the image cannot be decoded.
+    """
+    try:
+        img = Image.open(BytesIO(blob))
+        img.draft("RGB", (size * 4, size * 4))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        aspect = img.width / img.height
+        colour = img.resize((1, 1), Image.BOX).getpixel((0, 0))
+        gray = img.convert("L").resize((size + 1, size), Image.LANCZOS)
+    except Exception as e:
+        logger.warning("Could not decode image for perceptual hashing: %s", e)
+        return None
+
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return ImageSignature(value, colour, aspect)
+
+
+def _near_duplicates(a: ImageSignature, b: ImageSignature, max_distance: int, bits: int = 64) -> bool:
+    # a hash of (almost) all zeros or ones comes from a plain or evenly shaded image, e.g. a close-up
+    # of a bare panel; such hashes match each other regardless of content, so they are never merged
+    for value in (a.dhash, b.dhash):
+        if min(bin(value).count("1"), bits - bin(value).count("1")) <= max_distance:
+            return False
+    if bin(a.dhash ^ b.dhash).count("1") > max_distance:
+        return False
+    if max(abs(x - y) for x, y in zip(a.colour, b.colour)) > _MAX_COLOUR_DIFFERENCE:
+        return False
+    return abs(a.aspect - b.aspect) <= _MAX_ASPECT_DIFFERENCE * max(a.aspect, b.aspect)
+
+
+def group_near_duplicates(signatures: List[Optional[ImageSignature]],
+                          sizes: List[int],
+                          max_distance: int = IMAGE_DEDUP_MAX_DISTANCE) -> List[int]:
+    """
+    Clusters images whose hashes differ in at most max_distance bits and whose colour
+    and aspect ratio match. Returns for every image the index of the image that represents
+    its cluster, the largest one, so a re-upload at a lower resolution is never preferred.
+    """
+    clusters: List[List[int]] = []
+    for index, signature in enumerate(signatures):
+        if signature is not None:
+            for cluster in clusters:
+                first = signatures[cluster[0]]
+                if first is not None and _near_duplicates(signature, first, max_distance):
+                    cluster.append(index)
+                    break
+            else:
+                clusters.append([index])
+        else:
+            clusters.append([index])
+
+    representatives = list(range(len(signatures)))
+    for cluster in clusters:
+        best = max(cluster, key=lambda i: sizes[i])
+        for index in cluster:
+            representatives[index] = best
+    return representatives
+
+
+async def find_near_duplicates(blobs: List[bytes],
+                               max_distance: int = IMAGE_DEDUP_MAX_DISTANCE) -> List[int]:
+    """
+    Hashes the images in the preprocessing worker pool and groups near-duplicates,
+    see group_near_duplicates
+    """
+    loop = asyncio.get_running_loop()
+    signatures = await asyncio.gather(*[loop.run_in_executor(_EXECUTOR, image_signature, blob) for blob in blobs])
+    return group_near_duplicates(list(signatures), [len(blob) for blob in blobs], max_distance)
@@ -0,0 +1,281 @@
+import functools
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from konfiguracija import VEHICLE_PARTS_CONFIGURATION
+
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to a character estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FILE_MAPPING = {
+    'general': 'generalna_forma_izlaza.json',
+    'eu_report': 'eu_izvestaj_forma_izlaze.json'
+}
+
+# gpt-4o tokenizer; Gemini counts differ slightly but the trend is what matters
+TOKENIZER_NAME = "o200k_base"
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    """
+    Loads the tokenizer once; None if tiktoken or its encoding file is unavailable
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKENIZER_NAME)
+    except Exception as e:  # the encoding file may not be downloadable
+        logger.warning("tiktoken is unavailable (%s), estimating token counts.", e)
+        return None
+
+
+def count_tokens(text: str) -> Dict[str, Any]:
+    """
+    Counts the tokens of a text with tiktoken, or estimates them at 4 characters per token
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return {"tokens": len(encoding.encode(text)), "tokenizer": TOKENIZER_NAME}
+    return {"tokens": (len(text) + 3) // 4, "tokenizer": "chars/4"}
+
+
+class PromptTemplate:
+    """
+    A prompt split into a static prefix, identical byte for byte on every request,
+    and a suffix template holding everything that varies per request.
+    Providers cache the longest common prefix, so nothing request specific may go into the prefix.
+    """
+
+    def __init__(self, name: str, version: str, prefix: str, suffix_template: str = ""):
+        self.name = name
+        self.version = version
+        self.prefix = prefix
+        self.suffix_template = suffix_template
+        self.fingerprint = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:12]
+
+    @functools.cached_property
+    def prefix_tokens(self) -> Dict[str, Any]:
+        # counted on first report, so importing the app never waits for the tokenizer download
+        return count_tokens(self.prefix)
+
+    @property
+    def tag(self) -> str:
+        """
+        Identifies the exact prompt; used in result cache keys
+        """
+        return f"{self.name}@{self.version}:{self.fingerprint}"
+
+    def render_suffix(self, **values) -> str:
+        return self.suffix_template.format(**values)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "prefix_chars": len(self.prefix),
+            "prefix_tokens": self.prefix_tokens["tokens"],
+            "tokenizer": self.prefix_tokens["tokenizer"],
+        }
+
+
+class PromptRegistry:
+    """
+    Prompts built once at import time and looked up by name
+    """
+
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, template: PromptTemplate) -> PromptTemplate:
+        self._templates[template.name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        return {name: template.info() for name, template in self._templates.items()}
+
+
+def _dump(value: Any) -> str:
+    # compact serialization; the values come from fixed files and literals, so their key order is
+    # already stable between processes and is kept, since the model answers in the order it is shown
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def load_output_forms() -> Dict[str, dict]:
+    """
+    Reads the output forms of all document types
+    """
+    forms = {}
+    for document_type, path in OUTPUT_FILE_MAPPING.items():
+        with open(path, 'rb') as f:
+            forms[document_type] = json.load(f)
+    return forms
+
+
+OUTPUT_FORMS = load_output_forms()
+
+PROMPTS = PromptRegistry()
+
+
+def _extraction_prompt(document_type: str) -> PromptTemplate:
+    prefix = (
+        "You are a highly accurate data-extraction tool. "
+        "Given the full OCR output from a document, "
+        "return ONLY a single, valid JSON object by filling in the values. "
+        "You will likely be given a text in English or Serbian. "
+        "Correct some obvious mistakes if you estimate that they are made, "
+        "but do not write anything else. "
+        f"Here is the format of the output: {_dump(OUTPUT_FORMS[document_type])}"
+    )
+    return PromptTemplate(f"report_extraction_{document_type}", "3", prefix, "**INPUT**\n{ocr_json}")
+
+
+for _document_type in OUTPUT_FILE_MAPPING:
+    PROMPTS.register(_extraction_prompt(_document_type))
+
+
+DAMAGE_INSPECTION_PROMPT = PROMPTS.register(PromptTemplate(
+    "damage_inspection",
+    "2",
+    f"""System: You are an expert car-damage inspector.
+
+CONFIG = {_dump(VEHICLE_PARTS_CONFIGURATION)}
+
+You will receive a set of vehicle photos, followed by their file names in the same order.
+
+Return ONLY this single JSON object, with exactly these keys:
+{{
+  "damages": [
+    {{
+      "group":     "<one of CONFIG[\\"groups\\"]>",
+      "part":      "<one of CONFIG[\\"parts\\"]>",
+      "type":      "<one of CONFIG[\\"types\\"]>",
+      "side":      "<one of CONFIG[\\"sides\\"]>",
+      "severity":  "<one of CONFIG[\\"severities\\"]>",
+      "coordinates": [
+        {{
+          "projection": "<one of CONFIG[\\"projections\\"]>",
+          "segment":    "<one of CONFIG[\\"segments\\"]>",
+          "photos": [
+            {{ "type":"OVERVIEW_WITH_REGISTRATION","photoId":"","url":"","preDamagePhoto":false }},
+            {{ "type":"DAMAGE_AREA",               "photoId":"","url":"","preDamagePhoto":false }},
+            {{ "type":"DAMAGE_DETAIL",             "photoId":"","url":"","preDamagePhoto":false }}
+          ]
+        }}
+      ]
+    }}
+    /* one per unique damage index … */
+  ]
+}}
+Do NOT output any extra text or markdown—only the raw JSON.""",
+    "Here are the images you received, in order:\n{image_list}",
+))
+
+
+# damage fields sent as indices into the CONFIG list of the same name
+DAMAGE_ENUM_FIELDS = {
+    "group": "groups",
+    "part": "parts",
+    "type": "types",
+    "side": "sides",
+    "severity": "severities",
+}
+COORDINATE_ENUM_FIELDS = {
+    "projection": "projections",
+    "segment": "segments",
+}
+PHOTO_TYPES = ["OVERVIEW_WITH_REGISTRATION", "DAMAGE_AREA", "DAMAGE_DETAIL"]
+
+
+def _index_schema(labels: list) -> Dict[str, Any]:
+    return {"type": "INTEGER", "minimum": 0, "maximum": len(labels) - 1}
+
+
+def _object_schema(properties: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "OBJECT",
+        "properties": properties,
+        "required": list(properties),
+        "property_ordering": list(properties),
+    }
+
+
+DAMAGE_RESPONSE_SCHEMA = _object_schema({
+    "damages": {
+        "type": "ARRAY",
+        "items": _object_schema(dict(
+            {field: _index_schema(VEHICLE_PARTS_CONFIGURATION[key]) for field, key in DAMAGE_ENUM_FIELDS.items()},
+            coordinates={
+                "type": "ARRAY",
+                "items": _object_schema(dict(
+                    {field: _index_schema(VEHICLE_PARTS_CONFIGURATION[key])
+                     for field, key in COORDINATE_ENUM_FIELDS.items()},
+                    photos={
+                        "type": "ARRAY",
+                        "items": _object_schema({
+                            "type": _index_schema(PHOTO_TYPES),
+                            "image": {"type": "INTEGER", "minimum": 1},
+                        }),
+                    },
+                )),
+            },
+        )),
+    },
+})
+
+
+def _numbered(labels: list) -> str:
+    return "; ".join(f"{i}={label}" for i, label in enumerate(labels))
+
+
+_LABEL_TABLES = "\n".join(
+    f"{key}: {_numbered(VEHICLE_PARTS_CONFIGURATION[key])}"
+    for key in list(DAMAGE_ENUM_FIELDS.values()) + list(COORDINATE_ENUM_FIELDS.values())
+)
+
+STRUCTURED_DAMAGE_INSPECTION_PROMPT = PROMPTS.register(PromptTemplate(
+    "damage_inspection_structured",
+    "1",
+    f"""System: You are an expert car-damage inspector.
+
+Every label is given by its number:
+{_LABEL_TABLES}
+photo types: {_numbered(PHOTO_TYPES)}
+
+You will receive a set of vehicle photos, followed by their file names in the same order.
+
+Report every unique damage once. For each damage give the numbers of its group, part, type, side and severity.
+For every view of the damage give the numbers of its projection and segment, and the photos that show it,
+each as its photo type number and its image number (1-based, from the list of images).""",
+    "Here are the images you received, in order:\n{image_list}",
+))
+
+
+def get_output_form(document_type: Optional[str]) -> dict:
+    """
+    Get the output form from the document type
+    """
+    # if document_type is not specified
+    if document_type is None:
+        document_type = 'general'
+
+    if document_type not in OUTPUT_FORMS:
+        raise ValueError(f"{document_type} is an invalid document type. Please choose 'general' or 'eu_report'.")
+    return OUTPUT_FORMS[document_type]
+
+
+def get_extraction_prompt(document_type: Optional[str]) -> PromptTemplate:
+    """
+    Get the extraction prompt of a document type
+    """
+    get_output_form(document_type)
+    return PROMPTS.get(f"report_extraction_{document_type or 'general'}")
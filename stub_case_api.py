@@ -0,0 +1,130 @@
+"""
+Local stand-in for the damage case API, for testing /analyze_case without the real service.
+
+Every case id is answered with one case whose damages reference the images in --images
+(three photos per damage); the case id "empty" returns no cases. The JSON response is sent
+in small chunks with a delay, so incremental URL discovery can be observed. The photos are
+served by the same server.
+
+Usage:
+    python stub_case_api.py --images ./photos --port 8090 --chunk-delay 0.2
+    DAMAGE_CASE_API_URL=http://localhost:8090/damage-cases uvicorn main:app
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".heic")
+PHOTO_TYPES = ["OVERVIEW_WITH_REGISTRATION", "DAMAGE_AREA", "DAMAGE_DETAIL"]
+PROJECTIONS = ["FRONT_SIDE", "DRIVER_SIDE", "BACK_SIDE", "PASSENGER_SIDE"]
+
+
+def build_case(case_id: str, base_url: str, names: list) -> list:
+    damages = []
+    for start in range(0, len(names), len(PHOTO_TYPES)):
+        photos = [
+            {
+                "type": photo_type,
+                "photoId": f"{case_id}-{start + i}",
+                "url": f"{base_url}/photos/{quote(name)}",
+                "preDamagePhoto": False,
+            }
+            for i, (photo_type, name) in enumerate(zip(PHOTO_TYPES, names[start:start + len(PHOTO_TYPES)]))
+        ]
+        damages.append({
+            "coordinates": [{
+                "projection": PROJECTIONS[len(damages) % len(PROJECTIONS)],
+                "segment": "MID_MID",
+                "photos": photos,
+            }],
+        })
+    return [{"damageCaseId": case_id, "damages": damages}]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    images_dir = "."
+    token = None
+    chunk_size = 256
+    chunk_delay = 0.0
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/damage-cases":
+            self._case(parse_qs(url.query))
+        elif url.path.startswith("/photos/"):
+            self._photo(unquote(url.path[len("/photos/"):]))
+        else:
+            self._send(404, b'{"detail": "not found"}')
+
+    def _case(self, query):
+        if self.token and self.headers.get("Authorization") != f"Bearer {self.token}":
+            self._send(401, b'{"detail": "unauthorized"}')
+            return
+        case_id = query.get("value", [""])[0]
+        names = sorted(n for n in os.listdir(self.images_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+        cases = [] if case_id == "empty" else build_case(case_id, f"http://{self.headers['Host']}", names)
+        body = json.dumps(cases, indent=2).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for start in range(0, len(body), self.chunk_size):
+            chunk = body[start:start + self.chunk_size]
+            self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.chunk_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _photo(self, name):
+        path = os.path.join(self.images_dir, os.path.basename(name))
+        if not os.path.isfile(path):
+            self._send(404, b'{"detail": "not found"}')
+            return
+        with open(path, "rb") as f:
+            blob = f.read()
+        etag = '"' + hashlib.sha256(blob).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send(200, blob, content_type="application/octet-stream", extra_headers={"ETag": etag})
+
+    def _send(self, status, body, content_type="application/json", extra_headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="directory with the photos to serve")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--token", default=None, help="require this bearer token")
+    parser.add_argument("--chunk-size", type=int, default=256, help="bytes per response chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.1, help="seconds between response chunks")
+    args = parser.parse_args()
+
+    StubHandler.images_dir = args.images
+    StubHandler.token = args.token
+    StubHandler.chunk_size = args.chunk_size
+    StubHandler.chunk_delay = args.chunk_delay
+
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), StubHandler)
+    print(f"Damage case API stub on http://localhost:{args.port}/damage-cases")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
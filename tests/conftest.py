@@ -0,0 +1,65 @@
+import os
+import random
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+# keep the tests away from the on-disk caches and the shared job database
+os.environ.setdefault("JOB_STORE_BACKEND", "memory")
+os.environ.setdefault("IMAGE_CACHE_ENABLED", "false")
+os.environ.setdefault("OCR_CACHE_ENABLED", "false")
+os.environ.setdefault("INCREMENTAL_INSPECTION_ENABLED", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def photo_bytes(seed: int, size=(640, 480)) -> bytes:
+    """
+    A JPEG of random shapes, distinct for every seed
+    """
+    from io import BytesIO
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (120, 130, 140))
+    draw = ImageDraw.Draw(img)
+    for _ in range(30):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse((x, y, x + rng.randrange(40, 200), y + rng.randrange(40, 200)),
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    stream = BytesIO()
+    img.save(stream, format="JPEG", quality=90)
+    return stream.getvalue()
+
+
+@pytest.fixture
+def case_api(tmp_path, monkeypatch):
+    """
+    Runs stub_case_api.py on a free port with six distinct photos and points the app at it
+    """
+    import stub_case_api
+    import vizualna_anliza_ostecenja
+
+    for i in range(6):
+        (tmp_path / f"photo{i}.jpg").write_bytes(photo_bytes(i))
+
+    handler = type("Handler", (stub_case_api.StubHandler,), {"images_dir": str(tmp_path), "chunk_delay": 0.0})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/damage-cases"
+    monkeypatch.setattr(vizualna_anliza_ostecenja, "DAMAGE_CASE_API_URL", url)
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,54 @@
+import vizualna_anliza_ostecenja
+
+
+def test_unknown_case_is_404(case_api, client):
+    response = client.post("/analyze_case", json={"case_id": "empty", "bypass_cache": True})
+
+    assert response.status_code == 404
+
+
+def test_case_photos_are_downloaded_and_inspected(case_api, client, monkeypatch):
+    inspected = []
+
+    async def fake_inspect_images(images, image_names, mode=None):
+        inspected.append(list(image_names))
+        return {"damages": [{
+            "part": "DOOR", "side": "LEFT", "type": "SCRATCH",
+            "coordinates": [{"projection": "DRIVER_SIDE", "segment": "MID_MID",
+                             "photos": [{"type": "DAMAGE_AREA", "photoId": image_names[0], "url": ""}]}],
+        }]}
+
+    monkeypatch.setattr(vizualna_anliza_ostecenja, "inspect_images", fake_inspect_images)
+
+    response = client.post("/analyze_case", json={"case_id": "CASE-1", "bypass_cache": True})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["case_id"] == "CASE-1"
+    assert len(body["photos"]) == 6
+    assert all(photo["downloaded"] for photo in body["photos"])
+    assert sorted(name for names in inspected for name in names) == [f"photo{i}.jpg" for i in range(6)]
+    assert body["result"]["damages"][0]["part"] == "DOOR"
+
+
+def test_case_api_error_is_502(case_api, client, monkeypatch):
+    import stub_case_api
+
+    monkeypatch.setattr(stub_case_api.StubHandler, "token", "secret")
+
+    response = client.post("/analyze_case", json={"case_id": "CASE-1", "auth_token": "wrong", "bypass_cache": True})
+
+    assert response.status_code == 502
+    assert response.json()["detail"] == "Damage case API returned 401."
+
+
+def test_inspection_timeout_is_not_blamed_on_the_case_api(case_api, client, monkeypatch):
+    async def slow_inspect_images(images, image_names, mode=None):
+        raise TimeoutError()
+
+    monkeypatch.setattr(vizualna_anliza_ostecenja, "inspect_images", slow_inspect_images)
+
+    response = client.post("/analyze_case", json={"case_id": "CASE-1", "bypass_cache": True})
+
+    assert response.status_code != 504
+    assert "Damage case API" not in response.text
@@ -0,0 +1,55 @@
+from io import BytesIO
+
+from PIL import Image
+
+from conftest import photo_bytes
+from priprema_slika import group_near_duplicates, image_signature
+from vizualna_anliza_ostecenja import _expand_aliases
+
+
+def _jpeg(img, quality=90):
+    stream = BytesIO()
+    img.save(stream, format="JPEG", quality=quality)
+    return stream.getvalue()
+
+
+def test_rescaled_copy_is_grouped_with_the_largest_image():
+    original = photo_bytes(1)
+    smaller = _jpeg(Image.open(BytesIO(original)).resize((320, 240)), quality=60)
+    blobs = [smaller, original, photo_bytes(2)]
+
+    representatives = group_near_duplicates([image_signature(blob) for blob in blobs], [len(b) for b in blobs])
+
+    assert representatives == [1, 1, 2]
+
+
+def test_plain_images_are_never_grouped():
+    blobs = [_jpeg(Image.new("RGB", (640, 480), colour)) for colour in [(200, 0, 0), (0, 0, 200), (200, 0, 0)]]
+
+    representatives = group_near_duplicates([image_signature(blob) for blob in blobs], [len(b) for b in blobs])
+
+    assert representatives == [0, 1, 2]
+
+
+def test_undecodable_image_stays_on_its_own():
+    blobs = [b"not an image", photo_bytes(3)]
+    signatures = [image_signature(blob) for blob in blobs]
+
+    assert signatures[0] is None
+    assert group_near_duplicates(signatures, [len(b) for b in blobs]) == [0, 1]
+
+
+def _damage(part, projection, photo_id):
+    return {"part": part, "side": "LEFT", "type": "DENT",
+            "coordinates": [{"projection": projection, "segment": "MID_MID",
+                             "photos": [{"type": "DAMAGE_AREA", "photoId": photo_id, "url": ""}]}]}
+
+
+def test_expand_aliases_adds_a_photo_per_alias():
+    damage = _damage("DOOR", "DRIVER_SIDE", "a.jpg")
+
+    _expand_aliases(damage, {"https://host/a.jpg": ["https://host/a-copy.jpg", "https://other/a2.jpg"]})
+
+    photos = damage["coordinates"][0]["photos"]
+    assert [photo["photoId"] for photo in photos] == ["a.jpg", "a-copy.jpg", "a2.jpg"]
+    assert all(photo["type"] == "DAMAGE_AREA" for photo in photos)
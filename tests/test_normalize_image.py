@@ -0,0 +1,25 @@
+from io import BytesIO
+
+from PIL import Image
+
+from conftest import photo_bytes
+from priprema_slika import normalize_image
+
+
+def test_small_jpeg_without_orientation_is_kept_as_is():
+    blob = photo_bytes(5, size=(320, 240))
+
+    assert normalize_image(blob, max_long_edge=1600) == (blob, "image/jpeg")
+
+
+def test_orientation_tag_is_applied():
+    img = Image.new("RGB", (320, 240), (10, 20, 30))
+    exif = img.getexif()
+    exif[0x0112] = 6  # rotated 90 degrees clockwise
+    stream = BytesIO()
+    img.save(stream, format="JPEG", exif=exif)
+
+    encoded, mime_type = normalize_image(stream.getvalue(), max_long_edge=1600)
+
+    assert mime_type == "image/jpeg"
+    assert Image.open(BytesIO(encoded)).size == (240, 320)
@@ -0,0 +1,27 @@
+import asyncio
+
+import vizualna_anliza_ostecenja
+from conftest import photo_bytes
+
+
+def test_cache_hit_is_renamed_to_the_names_of_the_request(monkeypatch):
+    async def fake_inspect_images(images, image_names, mode=None):
+        return {"damages": [{
+            "part": "DOOR", "side": "LEFT", "type": "DENT",
+            "coordinates": [{"projection": "DRIVER_SIDE", "segment": "MID_MID",
+                             "photos": [{"type": "DAMAGE_AREA", "photoId": image_names[0], "url": ""}]}],
+        }]}
+
+    monkeypatch.setattr(vizualna_anliza_ostecenja, "inspect_images", fake_inspect_images)
+    blob = photo_bytes(11)
+
+    first = asyncio.run(vizualna_anliza_ostecenja.inspect_downloaded(["https://host/old-a.jpg"], [blob]))
+    second = asyncio.run(vizualna_anliza_ostecenja.inspect_downloaded(["https://signed/new-a.jpg"], [blob]))
+
+    assert not first["cached"]
+    assert second["cached"]
+    photos = second["result"]["damages"][0]["coordinates"][0]["photos"]
+    assert [photo["photoId"] for photo in photos] == ["new-a.jpg"]
+    # the cached entry itself keeps its original names
+    third = asyncio.run(vizualna_anliza_ostecenja.inspect_downloaded(["https://host/old-a.jpg"], [blob]))
+    assert third["result"]["damages"][0]["coordinates"][0]["photos"][0]["photoId"] == "old-a.jpg"
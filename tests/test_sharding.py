@@ -0,0 +1,40 @@
+from vizualna_anliza_ostecenja import merge_damages, plan_shards
+
+
+def _damage(part, projection, photo_id):
+    return {"part": part, "side": "LEFT", "type": "DENT",
+            "coordinates": [{"projection": projection, "segment": "MID_MID",
+                             "photos": [{"type": "DAMAGE_AREA", "photoId": photo_id, "url": ""}]}]}
+
+
+def test_plan_shards_are_even_and_cover_every_image():
+    shards = plan_shards(25, shard_size=12)
+
+    assert [len(shard) for shard in shards] == [9, 9, 7]
+    assert sorted(i for shard in shards for i in shard) == list(range(25))
+
+
+def test_plan_shards_keep_groups_together():
+    groups = ["FRONT", "BACK", "FRONT", "BACK", "FRONT"]
+
+    shards = plan_shards(5, groups, shard_size=3)
+
+    assert shards == [[0, 2, 4], [1, 3]]
+
+
+def test_merge_damages_combines_views_of_the_same_damage():
+    merged = merge_damages([
+        {"damages": [_damage("DOOR", "DRIVER_SIDE", "a.jpg")]},
+        {"damages": [_damage("DOOR", "DRIVER_SIDE", "b.jpg"), _damage("HOOD", "FRONT_SIDE", "c.jpg")]},
+    ])["damages"]
+
+    assert [damage["part"] for damage in merged] == ["DOOR", "HOOD"]
+    photos = merged[0]["coordinates"][0]["photos"]
+    assert [photo["photoId"] for photo in photos] == ["a.jpg", "b.jpg"]
+
+
+def test_merge_damages_does_not_repeat_photos():
+    merged = merge_damages([{"damages": [_damage("DOOR", "DRIVER_SIDE", "a.jpg")]}] * 2)["damages"]
+
+    assert len(merged) == 1
+    assert len(merged[0]["coordinates"][0]["photos"]) == 1
@@ -0,0 +1,15 @@
+from vizualna_anliza_ostecenja import _partial_damages
+
+
+def test_partial_damages_of_an_incomplete_answer():
+    text = '```json\n{"damages": [{"part": 1, "side": 2}, {"part": 3, "coordi'
+
+    damages = _partial_damages(text)
+
+    assert damages[0] == {"part": 1, "side": 2}
+    assert len(damages) == 2
+
+
+def test_partial_damages_without_damages():
+    assert _partial_damages("") == []
+    assert _partial_damages('{"other": [1, 2') == []
@@ -0,0 +1,32 @@
+from vizualna_anliza_ostecenja import decode_structured_damages
+
+
+def _encoded(photos):
+    return {"damages": [{"group": 0, "part": 0, "type": 0, "side": 0, "severity": 0,
+                         "coordinates": [{"projection": 0, "segment": 0, "photos": photos}]}]}
+
+
+def test_photos_are_decoded_to_labels_and_names():
+    result = decode_structured_damages(_encoded([{"type": 1, "image": 2}]), ["a.jpg", "b.jpg"])
+
+    photo = result["damages"][0]["coordinates"][0]["photos"][0]
+    assert photo["type"] == "DAMAGE_AREA"
+    assert photo["photoId"] == "b.jpg"
+
+
+def test_bad_photo_reference_only_drops_the_photo():
+    photos = [{"type": 0, "image": 9}, {"type": 7, "image": 1}, {"type": 2, "image": 1}]
+
+    result = decode_structured_damages(_encoded(photos), ["a.jpg"])
+
+    assert "dropped_damages" not in result
+    assert [photo["type"] for photo in result["damages"][0]["coordinates"][0]["photos"]] == ["DAMAGE_DETAIL"]
+
+
+def test_bad_damage_label_drops_the_damage():
+    encoded = _encoded([])
+    encoded["damages"][0]["part"] = 10 ** 6
+
+    result = decode_structured_damages(encoded, ["a.jpg"])
+
+    assert result == {"damages": [], "dropped_damages": 1}
@@ -0,0 +1,48 @@
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from upload_spool import UploadLimitMiddleware
+
+BOUNDARY = "test-boundary"
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware, limits={"/upload": 1000})
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return app
+
+
+def _multipart(payload: bytes) -> bytes:
+    return (f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="file"; filename="report.pdf"\r\n'
+            "Content-Type: application/pdf\r\n\r\n").encode("ascii") + payload + f"\r\n--{BOUNDARY}--\r\n".encode("ascii")
+
+
+def _post(client, body: bytes, chunked: bool):
+    headers = {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    # a generator body is sent without Content-Length, in chunked transfer encoding
+    content = (body[i:i + 256] for i in range(0, len(body), 256)) if chunked else body
+    return client.post("/upload", content=content, headers=headers)
+
+
+def test_small_upload_passes():
+    with TestClient(_app()) as client:
+        assert _post(client, _multipart(b"x" * 100), chunked=True).json() == {"size": 100}
+
+
+def test_oversized_upload_with_content_length_is_413():
+    with TestClient(_app()) as client:
+        assert _post(client, _multipart(b"x" * 5000), chunked=False).status_code == 413
+
+
+def test_oversized_chunked_upload_is_413():
+    with TestClient(_app()) as client:
+        response = _post(client, _multipart(b"x" * 5000), chunked=True)
+
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Upload exceeds the limit of 1000 bytes."}
@@ -0,0 +1,169 @@
+import logging
+import math
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from transcriptions_store import JobStore, QUEUED, RUNNING, DONE, FAILED
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted while the transcription queue is full
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("Transcription queue is full")
+        self.retry_after = retry_after
+
+
+def _emit(guid: str, on_event: Optional[Callable[[str, Dict[str, Any]], None]], name: str, data: Any):
+    """
+    Reports a job event; a failing listener must not take the worker thread down
+    """
+    if on_event is None:
+        return
+    try:
+        on_event(name, data)
+    except Exception:
+        logger.exception("Could not report the %s event of transcription job %s.", name, guid)
+
+
+class TranscriptionScheduler:
+    """
+    Runs transcription jobs on a fixed number of worker threads fed from a bounded queue.
+    Job status and results are kept in the job store.
+    Jobs submitted with an on_event callback also report their progress through it:
+    ("running", {}), any events the job emits itself, then ("result", ...) or ("error", ...).
+    The payload of a job that never runs is passed to discard, if given.
+    """
+
+    def __init__(self,
+                 job: Callable[[Any], Any],
+                 store: JobStore,
+                 workers: int,
+                 max_queued: int,
+                 discard: Optional[Callable[[Any], None]] = None):
+        self.job = job
+        self.discard = discard
+        self.store = store
+        self.workers = workers
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queued)
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        # moving average of job duration, used for the Retry-After estimate
+        self._avg_duration: Optional[float] = None
+
+    def start(self):
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"transcription-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Started %d transcription worker(s).", self.workers)
+
+    def stop(self):
+        """
+        Stops the workers after their current job. Jobs still waiting in the queue fail.
+        Never blocks on a full queue.
+        """
+        self._stopping.set()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._abandon(item)
+            self._queue.task_done()
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                # workers also see the stop flag once their current job ends
+                break
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def retry_after(self) -> int:
+        """
+        Estimated number of seconds until a queue slot frees up
+        """
+        if self._avg_duration is None:
+            return 30
+        return max(1, math.ceil(self._avg_duration * self._queue.qsize() / self.workers))
+
+    def submit(self, guid: str, payload: Any,
+               on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Optional[int]:
+        """
+        Enqueues a job and returns its 1-based queue position (None if already picked up).
+        Raises QueueFullError if the queue is full.
+        """
+        if self._queue.full():
+            raise QueueFullError(self.retry_after())
+        self.store.create(guid)
+        try:
+            self._queue.put_nowait((guid, payload, on_event))
+        except queue.Full:
+            self.store.delete(guid)
+            raise QueueFullError(self.retry_after())
+        return self.store.queue_position(guid)
+
+    def _abandon(self, item: Tuple[str, Any, Any]):
+        guid, payload, on_event = item
+        error = "The service shut down before the job ran."
+        if self.store.transition(guid, QUEUED, FAILED, error=error):
+            _emit(guid, on_event, "error", {"error": error})
+        self._discard(guid, payload)
+
+    def _discard(self, guid: str, payload: Any):
+        if self.discard is None:
+            return
+        try:
+            self.discard(payload)
+        except Exception:
+            logger.exception("Could not discard the payload of transcription job %s.", guid)
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                item = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if item is None:
+                self._queue.task_done()
+                return
+            if self._stopping.is_set():
+                self._abandon(item)
+                self._queue.task_done()
+                return
+            guid, payload, on_event = item
+            if not self.store.transition(guid, QUEUED, RUNNING):
+                logger.warning("Transcription job %s is no longer queued, skipping.", guid)
+                _emit(guid, on_event, "error", {"error": "The transcription job is no longer queued."})
+                self._discard(guid, payload)
+                self._queue.task_done()
+                continue
+
+            started = time.monotonic()
+            try:
+                if on_event is None:
+                    result = self.job(payload)
+                else:
+                    _emit(guid, on_event, "running", {})
+                    result = self.job(payload, on_event=on_event)
+                self.store.transition(guid, RUNNING, DONE, result=result)
+                _emit(guid, on_event, "result", result)
+            except Exception as e:
+                logger.exception("Transcription job %s failed.", guid)
+                self.store.transition(guid, RUNNING, FAILED, error=str(e))
+                _emit(guid, on_event, "error", {"error": str(e)})
+            finally:
+                duration = time.monotonic() - started
+                self._avg_duration = duration if self._avg_duration is None \
+                    else 0.8 * self._avg_duration + 0.2 * duration
+                self._queue.task_done()
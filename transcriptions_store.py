@@ -1 +1,260 @@
-TRANSCRIPTION_DATA = {}
\ No newline at end of file
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+from konfiguracija import JOB_STORE_BACKEND, JOB_STORE_PATH, JOB_TTL_SECONDS
+
+# job lifecycle: queued -> running -> done | failed
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+ORPHANED_ERROR = "The service restarted before the job finished, please submit it again."
+
+
+class JobStore(ABC):
+    """
+    Interface of a transcription job store.
+    Status changes go through transition(), which only succeeds if the job
+    is still in the expected state, so concurrent workers cannot race each other.
+    Queue positions are relative to the jobs of this process, since every process has its own queue.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+
+    @abstractmethod
+    def create(self, guid: str):
+        pass
+
+    @abstractmethod
+    def transition(self, guid: str, from_status: str, to_status: str,
+                   result: Any = None, error: Optional[str] = None) -> bool:
+        pass
+
+    @abstractmethod
+    def get(self, guid: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def delete(self, guid: str):
+        pass
+
+    @abstractmethod
+    def queue_position(self, guid: str) -> Optional[int]:
+        pass
+
+    @abstractmethod
+    def evict_expired(self) -> int:
+        pass
+
+    def fail_orphaned(self) -> int:
+        """
+        Marks queued and running jobs of processes that no longer exist as failed
+        """
+        return 0
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Single-process job store, kept for local development and tests
+    """
+
+    def __init__(self, ttl: float):
+        super().__init__(ttl)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, guid: str):
+        self.evict_expired()
+        now = time.time()
+        with self._lock:
+            self._jobs[guid] = {"status": QUEUED, "result": None, "error": None,
+                                "created_at": now, "updated_at": now}
+
+    def transition(self, guid, from_status, to_status, result=None, error=None):
+        with self._lock:
+            job = self._jobs.get(guid)
+            if job is None or job["status"] != from_status:
+                return False
+            job.update(status=to_status, result=result, error=error, updated_at=time.time())
+            return True
+
+    def get(self, guid):
+        with self._lock:
+            job = self._jobs.get(guid)
+            if job is None or job["updated_at"] < time.time() - self.ttl:
+                return None
+            return dict(job)
+
+    def delete(self, guid):
+        with self._lock:
+            self._jobs.pop(guid, None)
+
+    def queue_position(self, guid):
+        with self._lock:
+            job = self._jobs.get(guid)
+            if job is None or job["status"] != QUEUED:
+                return None
+            return 1 + sum(1 for other in self._jobs.values()
+                           if other["status"] == QUEUED and other["created_at"] < job["created_at"])
+
+    def evict_expired(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [guid for guid, job in self._jobs.items() if job["updated_at"] < cutoff]
+            for guid in expired:
+                del self._jobs[guid]
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store backed by an SQLite database in WAL mode, shared by all worker
+    processes on the host and surviving restarts.
+    Every job records the process that queued it. A process holds an exclusive lock on
+    its owner file while it lives, so jobs whose owner lock is free were orphaned by a crash or restart.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        super().__init__(ttl)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.owner_dir = os.path.join(directory or ".", "job_owners")
+        os.makedirs(self.owner_dir, exist_ok=True)
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        # released by the OS when the process exits, however it exits
+        self._owner_lock = open(self._owner_path(self.owner), "w")
+        fcntl.flock(self._owner_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "guid TEXT PRIMARY KEY, status TEXT NOT NULL, result TEXT, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, owner TEXT)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _owner_path(self, owner: str) -> str:
+        return os.path.join(self.owner_dir, f"{owner}.lock")
+
+    def _owner_alive(self, owner: Optional[str]) -> bool:
+        if owner is None:
+            return False
+        if owner == self.owner:
+            return True
+        path = self._owner_path(owner)
+        if not os.path.exists(path):
+            return False
+        with open(path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+        os.remove(path)
+        return False
+
+    def create(self, guid):
+        now = time.time()
+        with self._connect() as conn:
+            # expired jobs are dropped on the write path, never while polling
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (now - self.ttl,))
+            conn.execute(
+                "INSERT INTO jobs (guid, status, created_at, updated_at, owner) VALUES (?, ?, ?, ?, ?)",
+                (guid, QUEUED, now, now, self.owner)
+            )
+
+    def transition(self, guid, from_status, to_status, result=None, error=None):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? "
+                "WHERE guid = ? AND status = ?",
+                (to_status, json.dumps(result) if result is not None else None,
+                 error, time.time(), guid, from_status)
+            )
+            return cursor.rowcount == 1
+
+    def get(self, guid):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, result, error, created_at, updated_at FROM jobs WHERE guid = ? AND updated_at >= ?",
+                (guid, time.time() - self.ttl)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "status": row[0],
+            "result": json.loads(row[1]) if row[1] is not None else None,
+            "error": row[2],
+            "created_at": row[3],
+            "updated_at": row[4],
+        }
+
+    def delete(self, guid):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE guid = ?", (guid,))
+
+    def queue_position(self, guid):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 + (SELECT COUNT(*) FROM jobs o "
+                "WHERE o.status = ? AND o.owner IS j.owner AND o.created_at < j.created_at) "
+                "FROM jobs j WHERE j.guid = ? AND j.status = ?",
+                (QUEUED, guid, QUEUED)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def evict_expired(self):
+        with self._connect() as conn:
+            cursor = conn.execute("DELETE FROM jobs WHERE updated_at < ?", (time.time() - self.ttl,))
+            return cursor.rowcount
+
+    def fail_orphaned(self):
+        with self._connect() as conn:
+            owners = [row[0] for row in conn.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING))]
+            failed = 0
+            for owner in owners:
+                if self._owner_alive(owner):
+                    continue
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+                    "WHERE status IN (?, ?) AND owner IS ?",
+                    (FAILED, ORPHANED_ERROR, time.time(), QUEUED, RUNNING, owner)
+                )
+                failed += cursor.rowcount
+        # owner files of exited processes without unfinished jobs
+        for name in os.listdir(self.owner_dir):
+            if name.endswith(".lock"):
+                self._owner_alive(name[:-len(".lock")])
+        return failed
+
+
+def create_job_store(backend: str = JOB_STORE_BACKEND) -> JobStore:
+    if backend == "sqlite":
+        return SQLiteJobStore(JOB_STORE_PATH, ttl=JOB_TTL_SECONDS)
+    if backend == "memory":
+        return InMemoryJobStore(ttl=JOB_TTL_SECONDS)
+    raise ValueError(f"{backend} is an invalid job store backend. Please choose 'sqlite' or 'memory'.")
+
+
+TRANSCRIPTION_STORE = create_job_store()
@@ -0,0 +1,209 @@
+import logging
+import queue
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from konfiguracija import (
+    WHISPER_MODEL_NAME,
+    WHISPER_DEVICE,
+    WHISPER_COMPUTE_TYPE,
+    WHISPER_CPU_THREADS,
+    WHISPER_NUM_WORKERS,
+    WHISPER_BEAM_SIZE,
+    WHISPER_VAD_FILTER,
+    WHISPER_POOL_SIZE,
+    WHISPER_LANGUAGE,
+    WHISPER_LIFECYCLE,
+    MODEL_IDLE_TIMEOUT,
+    LONG_AUDIO_THRESHOLD_SECONDS,
+    LONG_AUDIO_CHUNK_SECONDS,
+    LONG_AUDIO_PROCESSES,
+)
+from model_lifecycle import ManagedResource, LIFECYCLE
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+# segment with timestamps relative to the whole recording
+TranscribedSegment = namedtuple("TranscribedSegment", ["start", "end", "text"])
+
+
+def load_whisper_model(model_name: str = WHISPER_MODEL_NAME,
+                       compute_type: str = WHISPER_COMPUTE_TYPE,
+                       cpu_threads: int = WHISPER_CPU_THREADS,
+                       num_workers: int = WHISPER_NUM_WORKERS):
+    """
+    Loads a Whisper model with the configured inference settings
+    """
+    # imported here so that importing the app does not pull in CTranslate2
+    from faster_whisper import WhisperModel
+
+    logger.info("Loading Whisper model %s (compute_type=%s, cpu_threads=%s, num_workers=%s)",
+                model_name, compute_type, cpu_threads, num_workers)
+    return WhisperModel(model_name,
+                        device=WHISPER_DEVICE,
+                        compute_type=compute_type,
+                        cpu_threads=cpu_threads,
+                        num_workers=num_workers)
+
+
+class WhisperModelPool:
+    """
+    Fixed-size pool of Whisper model replicas, so concurrent transcriptions
+    do not serialize on a single model instance
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._models: "queue.Queue" = queue.Queue()
+        for _ in range(size):
+            self._models.put(load_whisper_model())
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        model = self._models.get(timeout=timeout)
+        try:
+            yield model
+        finally:
+            self._models.put(model)
+
+    def warmup(self):
+        """
+        Runs one short inference on every replica so the first real job does not pay for it
+        """
+        import numpy as np
+
+        silence = np.zeros(16000, dtype=np.float32)
+        for _ in range(self.size):
+            with self.acquire() as model:
+                segments, _ = model.transcribe(silence, beam_size=1)
+                list(segments)
+
+
+WHISPER_POOL = LIFECYCLE.register(ManagedResource(
+    "whisper",
+    loader=lambda: WhisperModelPool(WHISPER_POOL_SIZE),
+    policy=WHISPER_LIFECYCLE,
+    idle_timeout=MODEL_IDLE_TIMEOUT,
+    warmup=lambda pool: pool.warmup(),
+))
+
+
+def plan_chunks(speech_timestamps: List[Dict[str, int]],
+                total_samples: int,
+                chunk_samples: int) -> List[Tuple[int, int]]:
+    """
+    Splits a recording into (start, end) sample ranges of roughly chunk_samples,
+    cutting in the middle of the silence between two speech regions.
+    A single speech region longer than twice the chunk length is cut hard.
+    """
+    chunks = []
+    chunk_start = 0
+    for current, following in zip(speech_timestamps, speech_timestamps[1:]):
+        cut = (current["end"] + following["start"]) // 2
+        if cut - chunk_start < chunk_samples:
+            continue
+        while cut - chunk_start > 2 * chunk_samples:
+            chunks.append((chunk_start, chunk_start + chunk_samples))
+            chunk_start += chunk_samples
+        chunks.append((chunk_start, cut))
+        chunk_start = cut
+    while total_samples - chunk_start > 2 * chunk_samples:
+        chunks.append((chunk_start, chunk_start + chunk_samples))
+        chunk_start += chunk_samples
+    if chunk_start < total_samples:
+        chunks.append((chunk_start, total_samples))
+    return chunks
+
+
+_CHUNK_MODEL = None
+
+
+def _init_chunk_worker(cpu_threads: int):
+    # runs once in every chunk worker process
+    global _CHUNK_MODEL
+    _CHUNK_MODEL = load_whisper_model(cpu_threads=cpu_threads, num_workers=1)
+
+
+def _transcribe_chunk(audio, beam_size: int, vad_filter: bool) -> List[Tuple[float, float, str]]:
+    segments, _ = _CHUNK_MODEL.transcribe(audio, beam_size=beam_size, vad_filter=vad_filter,
+                                          language=WHISPER_LANGUAGE)
+    return [(segment.start, segment.end, segment.text) for segment in segments]
+
+
+def _create_chunk_executor(processes: int = LONG_AUDIO_PROCESSES) -> ProcessPoolExecutor:
+    import os
+
+    # split the cores between the worker processes instead of oversubscribing them
+    cpu_threads = WHISPER_CPU_THREADS or max(1, (os.cpu_count() or 1) // processes)
+    return ProcessPoolExecutor(max_workers=processes,
+                               mp_context=get_context("spawn"),
+                               initializer=_init_chunk_worker,
+                               initargs=(cpu_threads,))
+
+
+CHUNK_EXECUTOR = LIFECYCLE.register(ManagedResource(
+    "whisper_chunk_workers",
+    loader=_create_chunk_executor,
+    policy=WHISPER_LIFECYCLE,
+    idle_timeout=MODEL_IDLE_TIMEOUT,
+    unloader=lambda executor: executor.shutdown(wait=False, cancel_futures=True),
+))
+
+
+def iter_chunked_segments(audio,
+                          executor: ProcessPoolExecutor,
+                          chunk_seconds: float = LONG_AUDIO_CHUNK_SECONDS,
+                          beam_size: int = WHISPER_BEAM_SIZE,
+                          vad_filter: bool = WHISPER_VAD_FILTER) -> Iterator[TranscribedSegment]:
+    """
+    Transcribes a decoded recording in parallel chunks split at silences.
+    Segments are yielded in order, each chunk as soon as it and all chunks before it are done.
+    """
+    from faster_whisper.vad import get_speech_timestamps
+
+    speech = get_speech_timestamps(audio)
+    chunks = plan_chunks(speech, len(audio), int(chunk_seconds * SAMPLING_RATE))
+    logger.info("Transcribing %.1fs of audio in %d parallel chunk(s).", len(audio) / SAMPLING_RATE, len(chunks))
+
+    futures = [executor.submit(_transcribe_chunk, audio[start:end], beam_size, vad_filter)
+               for start, end in chunks]
+    try:
+        for (start, _), future in zip(chunks, futures):
+            offset = start / SAMPLING_RATE
+            for seg_start, seg_end, text in future.result():
+                yield TranscribedSegment(seg_start + offset, seg_end + offset, text)
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def iter_segments(audio: Any,
+                  beam_size: int = WHISPER_BEAM_SIZE,
+                  vad_filter: bool = WHISPER_VAD_FILTER) -> Iterator[Any]:
+    """
+    Yields transcription segments as they are decoded.
+    Recordings longer than LONG_AUDIO_THRESHOLD_SECONDS are split into chunks
+    and transcribed in parallel worker processes.
+    The model replica stays checked out of the pool until the generator is exhausted or closed.
+    """
+    from faster_whisper.audio import decode_audio
+
+    audio = decode_audio(audio, sampling_rate=SAMPLING_RATE)
+    duration = len(audio) / SAMPLING_RATE
+
+    if LONG_AUDIO_PROCESSES > 1 and duration > LONG_AUDIO_THRESHOLD_SECONDS:
+        with CHUNK_EXECUTOR.use() as executor:
+            yield from iter_chunked_segments(audio, executor, beam_size=beam_size, vad_filter=vad_filter)
+        return
+
+    with WHISPER_POOL.use() as pool, pool.acquire() as model:
+        segments, info = model.transcribe(audio, beam_size=beam_size, vad_filter=vad_filter,
+                                          language=WHISPER_LANGUAGE)
+        logger.info("Detected language %s (%.2f), audio duration %.1fs",
+                    info.language, info.language_probability, info.duration)
+        yield from segments
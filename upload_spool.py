@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import tempfile
+import time
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+
+from konfiguracija import UPLOAD_CHUNK_BYTES, UPLOAD_SPOOL_DIR, UPLOAD_SPOOL_MAX_AGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class _UploadTooLarge(HTTPException):
+    # an HTTPException, so that FastAPI's body parsing passes it on as a 413 instead of a 400
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"Upload exceeds the limit of {limit} bytes.")
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware that rejects request bodies above a per-path size cap with 413.
+    The Content-Length header is checked before anything is read; bodies without
+    one are counted while they stream in and cut off as soon as they exceed the cap.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.limits:
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limits[scope["path"]]
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _UploadTooLarge(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _UploadTooLarge:
+            if response_started:
+                raise
+            await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        body = json.dumps({"detail": f"Upload exceeds the limit of {limit} bytes."}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode("ascii"))],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def check_upload_size(file: UploadFile, max_bytes: int):
+    """
+    Raises 413 if an already received upload is larger than max_bytes
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds the limit of {max_bytes} bytes.")
+
+
+async def spool_upload_to_disk(file: UploadFile, max_bytes: int) -> str:
+    """
+    Streams an upload in chunks into a temporary file that outlives the request
+    and returns its path. The caller is responsible for deleting it.
+    """
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    suffix = os.path.splitext(file.filename or "")[1]
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=UPLOAD_SPOOL_DIR)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds the limit of {max_bytes} bytes.")
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def remove_spooled(path: str):
+    """
+    Deletes a spooled upload if it is still there
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def sweep_spool_dir(max_age: float = UPLOAD_SPOOL_MAX_AGE_SECONDS) -> int:
+    """
+    Deletes spooled uploads older than max_age, left behind by jobs that never ran
+    """
+    if not os.path.isdir(UPLOAD_SPOOL_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(UPLOAD_SPOOL_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        logger.info("Removed %d stale spooled upload(s).", removed)
+    return removed
+
+
+def extract_zip_to_disk(archive_path: str,
+                        max_entry_bytes: int,
+                        max_total_bytes: int) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    Extracts the files of a zip archive into temporary files.
+    Returns (name, path, error) per file; entries above max_entry_bytes get an error instead of a path.
+    Sizes are counted while decompressing, the sizes claimed by the archive are not trusted.
+    """
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    too_large = f"File exceeds the limit of {max_entry_bytes} bytes."
+    entries = []
+    total = 0
+    path = None
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                name = info.filename
+                if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                    continue
+                if info.file_size > max_entry_bytes:
+                    entries.append((name, None, too_large))
+                    continue
+
+                fd, path = tempfile.mkstemp(suffix=os.path.splitext(name)[1], dir=UPLOAD_SPOOL_DIR)
+                written = 0
+                with os.fdopen(fd, "wb") as out, archive.open(info) as source:
+                    while written <= max_entry_bytes:
+                        chunk = source.read(UPLOAD_CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        written += len(chunk)
+                        total += len(chunk)
+                        if total > max_total_bytes:
+                            raise HTTPException(status_code=413,
+                                                detail=f"Archive content exceeds the limit of {max_total_bytes} bytes.")
+                        out.write(chunk)
+                if written > max_entry_bytes:
+                    os.remove(path)
+                    entries.append((name, None, too_large))
+                else:
+                    entries.append((name, path, None))
+                path = None
+    except BaseException:
+        for _, entry_path, _ in entries:
+            if entry_path is not None:
+                os.remove(entry_path)
+        if path is not None:
+            os.remove(path)
+        raise
+    return entries
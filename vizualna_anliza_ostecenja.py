@@ -1,37 +1,206 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, AsyncIterator, Callable, Optional, Tuple
+import asyncio
+import copy
+import jiter
+import httpx
 import requests
 import json
-import urllib.request
+import hashlib
+import logging
 from google.genai import types
-from konfiguracija import VEHICLE_PARTS_CONFIGURATION, get_gemini_credentials
+from konfiguracija import (
+    VEHICLE_PARTS_CONFIGURATION,
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_MAX_ENTRIES,
+    GEMINI_MODEL_NAME,
+    GEMINI_LIFECYCLE,
+    DAMAGE_OUTPUT_MODE,
+    IMAGE_DEDUP_ENABLED,
+    INSPECTION_SHARDING_ENABLED,
+    INSPECTION_SHARD_SIZE,
+    INSPECTION_SHARD_CONCURRENCY,
+    INCREMENTAL_INSPECTION_ENABLED,
+    FINDINGS_CACHE_PATH,
+    FINDINGS_CACHE_MAX_BYTES,
+    MODEL_IDLE_TIMEOUT,
+    IMAGE_BATCH_DEADLINE,
+    DAMAGE_CASE_API_URL,
+    DAMAGE_CASE_SOURCE,
+    DAMAGE_CASE_API_TOKEN,
+    DAMAGE_CASE_API_TIMEOUT,
+    get_gemini_credentials,
+)
+from model_lifecycle import ManagedResource, LIFECYCLE
+from preuzimanje_slika import download_image, download_images, collect_downloads, get_http_client
+from priprema_slika import normalize_images, find_near_duplicates, PREPROCESS_SIGNATURE
+from cache_store import DiskCache, TTLCache
+from promptovi import (
+    DAMAGE_INSPECTION_PROMPT,
+    STRUCTURED_DAMAGE_INSPECTION_PROMPT,
+    DAMAGE_RESPONSE_SCHEMA,
+    DAMAGE_ENUM_FIELDS,
+    COORDINATE_ENUM_FIELDS,
+    PHOTO_TYPES,
+)
+
+logger = logging.getLogger(__name__)
+
+GEMINI_CLIENT = LIFECYCLE.register(ManagedResource(
+    "gemini",
+    loader=lambda: get_gemini_credentials()[0],
+    policy=GEMINI_LIFECYCLE,
+    idle_timeout=MODEL_IDLE_TIMEOUT,
+))
+
+PARTS_CONFIGURATION_HASH = hashlib.sha256(
+    json.dumps(VEHICLE_PARTS_CONFIGURATION, sort_keys=True).encode("utf-8")
+).hexdigest()
+
+DAMAGE_PROMPTS = {
+    "text": DAMAGE_INSPECTION_PROMPT,
+    "structured": STRUCTURED_DAMAGE_INSPECTION_PROMPT,
+}
+if DAMAGE_OUTPUT_MODE not in DAMAGE_PROMPTS:
+    raise ValueError(f"{DAMAGE_OUTPUT_MODE} is an invalid damage output mode. "
+                     f"Please choose one of {tuple(DAMAGE_PROMPTS)}.")
+
+# everything besides the images that decides what the inspection returns
+INSPECTION_SIGNATURE = hashlib.sha256("\x00".join([
+    str(GEMINI_MODEL_NAME),
+    DAMAGE_PROMPTS[DAMAGE_OUTPUT_MODE].tag,
+    PARTS_CONFIGURATION_HASH,
+    PREPROCESS_SIGNATURE,
+]).encode("utf-8")).hexdigest()
+
+RESULT_CACHE = TTLCache(max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL)
+
+# findings of every inspected shard, keyed by the content hashes of its images
+FINDINGS_CACHE = DiskCache(FINDINGS_CACHE_PATH, FINDINGS_CACHE_MAX_BYTES) if INCREMENTAL_INSPECTION_ENABLED else None
+
+class CaseNotFoundError(LookupError):
+    """
+    Raised when the damage case API returns no photos for a case
+    """
+
+
+class CaseApiError(Exception):
+    """
+    Raised when the damage case API fails, answers with an error or times out
+    """
+
+    def __init__(self, message: str, timed_out: bool = False):
+        super().__init__(message)
+        self.timed_out = timed_out
+
+
+def case_photos(cases: Any) -> List[Dict[str, Any]]:
+    """
+    Flattens a damage case API response (damages -> coordinates -> photos) into one entry
+    per photo, together with the damage and coordinate it belongs to.
+    Also works on partially parsed responses.
+    """
+    photos: List[Dict[str, Any]] = []
+    if not isinstance(cases, list):
+        return photos
+    for case in cases:
+        if not isinstance(case, dict):
+            continue
+        for damage_index, damage in enumerate(case.get("damages") or []):
+            if not isinstance(damage, dict):
+                continue
+            for coordinate in damage.get("coordinates") or []:
+                if not isinstance(coordinate, dict):
+                    continue
+                for photo in coordinate.get("photos") or []:
+                    if not isinstance(photo, dict) or not photo.get("url"):
+                        continue
+                    photos.append({
+                        "url": photo["url"],
+                        "photoId": photo.get("photoId"),
+                        "type": photo.get("type"),
+                        "preDamagePhoto": photo.get("preDamagePhoto"),
+                        "damage_index": damage_index,
+                        "projection": coordinate.get("projection"),
+                        "segment": coordinate.get("segment"),
+                    })
+    return photos
 
-GEMINI_CLIENT, GEMINI_MODEL_NAME = get_gemini_credentials()
 
 def get_case_images2(
     damage_case_id: str = "",
     auth_token: str = "",
-    source: str = "AAA-1-RENT",
+    source: str = DAMAGE_CASE_SOURCE,
     key: str = "damageCaseId"
 ) -> List[str]:
-    api = (
-        "https://api-prod.orange.sixt.com/v1/vehicle-damage/"
-        f"external/damage-cases?key={key}&value={damage_case_id}&source={source}"
-    )
     headers = {"Authorization": f"Bearer {auth_token}"}
-    response = requests.get(api, headers=headers)
+    response = requests.get(DAMAGE_CASE_API_URL,
+                            params={"key": key, "value": damage_case_id, "source": source},
+                            headers=headers,
+                            timeout=DAMAGE_CASE_API_TIMEOUT)
     res = response.json()
 
-    image_urls: List[str] = []
-    if isinstance(res, list):
-        for case in res:
-            for damage in case.get("damages", []):
-                for coord in damage.get("coordinates", []):
-                    for photo in coord.get("photos", []):
-                        url = photo.get("url")
-                        if url:
-                            image_urls.append(url)
-    return image_urls
+    return [photo["url"] for photo in case_photos(res)]
+
+
+async def fetch_case(
+    damage_case_id: str,
+    on_photo_url: Callable[[str], None],
+    auth_token: Optional[str] = None,
+    source: str = DAMAGE_CASE_SOURCE,
+    key: str = "damageCaseId",
+) -> Any:
+    """
+    Streams a damage case from the case API on the shared client and calls on_photo_url
+    for every new photo URL as soon as it has fully arrived, before the rest of the response.
+    Returns the complete parsed response.
+    """
+    token = auth_token or DAMAGE_CASE_API_TOKEN
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    params = {"key": key, "value": damage_case_id, "source": source}
+    buffer = bytearray()
+    seen = set()
+
+    try:
+        async with asyncio.timeout(DAMAGE_CASE_API_TIMEOUT):
+            async with get_http_client().stream("GET", DAMAGE_CASE_API_URL, params=params, headers=headers,
+                                                timeout=DAMAGE_CASE_API_TIMEOUT) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.aiter_bytes():
+                    buffer.extend(chunk)
+                    try:
+                        # incomplete trailing strings are left out, so every URL seen here is whole
+                        partial = jiter.from_json(bytes(buffer), partial_mode=True)
+                    except ValueError:
+                        continue
+                    for photo in case_photos(partial):
+                        if photo["url"] not in seen:
+                            seen.add(photo["url"])
+                            on_photo_url(photo["url"])
+        return jiter.from_json(bytes(buffer))
+    # only errors of the case API itself are reported as such, see main.analyze_case
+    except (TimeoutError, httpx.TimeoutException) as e:
+        raise CaseApiError("Damage case API timed out.", timed_out=True) from e
+    except httpx.HTTPStatusError as e:
+        raise CaseApiError(f"Damage case API returned {e.response.status_code}.") from e
+    except httpx.RequestError as e:
+        raise CaseApiError(f"Damage case API is unreachable: {e}") from e
+    except ValueError as e:
+        raise CaseApiError("Damage case API returned invalid JSON.") from e
+
+
+def result_cache_key(blobs: List[bytes], sharding: str = "") -> str:
+    """
+    Builds the result cache key from the ordered image content hashes, the inspection signature
+    (model, prompt, vehicle parts configuration, preprocessing settings) and the shard layout.
+    Image names are not part of the key, a hit is renamed to the names of the request instead.
+    """
+    digest = hashlib.sha256()
+    for blob in blobs:
+        digest.update(hashlib.sha256(blob).digest())
+    digest.update(INSPECTION_SIGNATURE.encode("utf-8"))
+    digest.update(sharding.encode("utf-8"))
+    return digest.hexdigest()
 
 
 def parse_gemini_output(raw_text: str) -> Dict[str, Any]:
@@ -49,61 +218,619 @@ def parse_gemini_output(raw_text: str) -> Dict[str, Any]:
         return {"error": str(e), "raw_text": raw_text}
 
 
-def batch_inspect(
-    image_urls: List[str],
-) -> Dict[str, Any]:
-    parts: List[types.Part] = []
+def _label(labels: List[str], index: Any) -> str:
+    if not isinstance(index, int) or not 0 <= index < len(labels):
+        raise IndexError(f"label index {index!r} out of range")
+    return labels[index]
 
-    for url in image_urls:
+
+def decode_structured_damages(encoded: Dict[str, Any], image_names: List[str]) -> Dict[str, Any]:
+    """
+    Turns the index-encoded structured output back into the labelled damage format.
+    Damages with an index outside of the configuration are dropped.
+    """
+    damages = []
+    dropped = 0
+    for item in encoded.get("damages", []):
         try:
-            resp = urllib.request.urlopen(url)
-            blob = resp.read()
-            parts.append(types.Part.from_bytes(data=blob, mime_type="image/jpeg"))
-        except Exception as e:
-            print(f"Error downloading image {url}: {e}")
-
-    image_list_text = "\n".join(f"{i+1}) {url.split('/')[-1]}" for i, url in enumerate(image_urls))
-
-    prompt = f"""System: You are an expert car-damage inspector.
-
-    CONFIG = {VEHICLE_PARTS_CONFIGURATION}
-
-    Here are the images you will receive, in order:
-    {image_list_text}
-
-    Now return ONLY this single JSON object, with exactly these keys:
-    {{
-      "damages": [
-        {{
-          "group":     "<one of CONFIG[\\"groups\\"]>",
-          "part":      "<one of CONFIG[\\"parts\\"]>",
-          "type":      "<one of CONFIG[\\"types\\"]>",
-          "side":      "<one of CONFIG[\\"sides\\"]>",
-          "severity":  "<one of CONFIG[\\"severities\\"]>",
-          "coordinates": [
-            {{
-              "projection": "<one of CONFIG[\\"projections\\"]>",
-              "segment":    "<one of CONFIG[\\"segments\\"]>",
-              "photos": [
-                {{ "type":"OVERVIEW_WITH_REGISTRATION","photoId":"","url":"","preDamagePhoto":false }},
-                {{ "type":"DAMAGE_AREA",               "photoId":"","url":"","preDamagePhoto":false }},
-                {{ "type":"DAMAGE_DETAIL",             "photoId":"","url":"","preDamagePhoto":false }}
-              ]
-            }}
-          ]
-        }}
-        /* one per unique damage index … */
-      ]
-    }}
-    Do NOT output any extra text or markdown—only the raw JSON."""
-
-    parts.append(types.Part.from_text(text=prompt))
-
-    resp = GEMINI_CLIENT.models.generate_content(
+            damage = {field: _label(VEHICLE_PARTS_CONFIGURATION[key], item[field])
+                      for field, key in DAMAGE_ENUM_FIELDS.items()}
+            damage["coordinates"] = []
+            for coordinate in item["coordinates"]:
+                decoded = {field: _label(VEHICLE_PARTS_CONFIGURATION[key], coordinate[field])
+                           for field, key in COORDINATE_ENUM_FIELDS.items()}
+                decoded["photos"] = []
+                for photo in coordinate["photos"]:
+                    # a wrong image or photo type number only loses the photo reference, not the damage
+                    image = photo.get("image") if isinstance(photo, dict) else None
+                    if not isinstance(image, int) or not 1 <= image <= len(image_names):
+                        continue
+                    try:
+                        photo_type = _label(PHOTO_TYPES, photo.get("type"))
+                    except IndexError:
+                        continue
+                    decoded["photos"].append({
+                        "type": photo_type,
+                        "photoId": image_names[image - 1],
+                        "url": "",
+                        "preDamagePhoto": False,
+                    })
+                damage["coordinates"].append(decoded)
+        except (KeyError, IndexError, TypeError) as e:
+            logger.warning("Dropping undecodable damage %s: %s", item, e)
+            dropped += 1
+            continue
+        damages.append(damage)
+
+    result: Dict[str, Any] = {"damages": damages}
+    if dropped:
+        result["dropped_damages"] = dropped
+    return result
+
+
+def _inspection_request(
+    images: List[Tuple[bytes, str]],
+    image_names: List[str],
+    mode: str,
+) -> Tuple[List[types.Part], Optional[types.GenerateContentConfig]]:
+    prompt = DAMAGE_PROMPTS[mode]
+    image_list_text = "\n".join(f"{i+1}) {name}" for i, name in enumerate(image_names))
+
+    # static instructions first so Gemini can reuse the cached prefix, then the images and their names
+    parts: List[types.Part] = [types.Part.from_text(text=prompt.prefix)]
+    parts.extend(types.Part.from_bytes(data=blob, mime_type=mime_type) for blob, mime_type in images)
+    parts.append(types.Part.from_text(text=prompt.render_suffix(image_list=image_list_text)))
+
+    config = None
+    if mode == "structured":
+        config = types.GenerateContentConfig(response_mime_type="application/json",
+                                             response_schema=DAMAGE_RESPONSE_SCHEMA)
+    return parts, config
+
+
+async def run_inspection(
+    images: List[Tuple[bytes, str]],
+    image_names: List[str],
+    mode: str = DAMAGE_OUTPUT_MODE,
+) -> Tuple[Dict[str, Any], Dict[str, Optional[int]]]:
+    """
+    Sends already prepared (bytes, mime type) images to Gemini.
+    Returns the parsed damages and the token usage of the call.
+    """
+    parts, config = _inspection_request(images, image_names, mode)
+
+    resp = await GEMINI_CLIENT.get().aio.models.generate_content(
         model=GEMINI_MODEL_NAME,
-        contents=parts
+        contents=parts,
+        config=config,
     )
-    return parse_gemini_output(resp.text)
+
+    usage = resp.usage_metadata
+    token_usage = {
+        "prompt_tokens": usage.prompt_token_count if usage else None,
+        "completion_tokens": usage.candidates_token_count if usage else None,
+        "cached_tokens": usage.cached_content_token_count if usage else None,
+    }
+
+    result = parse_gemini_output(resp.text)
+    if mode == "structured" and "error" not in result:
+        result = decode_structured_damages(result, image_names)
+    return result, token_usage
+
+
+async def inspect_images(
+    images: List[Tuple[bytes, str]],
+    image_names: List[str],
+    mode: str = DAMAGE_OUTPUT_MODE,
+) -> Dict[str, Any]:
+    """
+    Sends already prepared (bytes, mime type) images to Gemini and returns the parsed damages
+    """
+    result, _ = await run_inspection(images, image_names, mode)
+    return result
+
+
+def _partial_damages(text: str) -> List[Any]:
+    """
+    Parses the damages array out of an incomplete Gemini answer
+    """
+    body = text.lstrip()
+    for fence in ("```json", "```"):
+        if body.startswith(fence):
+            body = body[len(fence):]
+            break
+    body = body.split("```", 1)[0]
+    try:
+        parsed = jiter.from_json(body.encode("utf-8"), partial_mode=True)
+    except ValueError:
+        return []
+    damages = parsed.get("damages") if isinstance(parsed, dict) else None
+    return damages if isinstance(damages, list) else []
+
+
+async def stream_inspection(
+    images: List[Tuple[bytes, str]],
+    image_names: List[str],
+    mode: str = DAMAGE_OUTPUT_MODE,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streams the Gemini answer and parses it while it arrives.
+    Yields ("damage", {"index": ..., "damage": ...}) for every element of the damages array
+    as soon as it is complete, then ("result", parsed result) once the answer is done.
+    """
+    parts, config = _inspection_request(images, image_names, mode)
+    stream = await GEMINI_CLIENT.get().aio.models.generate_content_stream(
+        model=GEMINI_MODEL_NAME,
+        contents=parts,
+        config=config,
+    )
+
+    text = ""
+    parsed_count = 0
+    sent = 0
+
+    def decode(damage):
+        if mode != "structured":
+            return damage if isinstance(damage, dict) else None
+        decoded = decode_structured_damages({"damages": [damage]}, image_names)["damages"]
+        return decoded[0] if decoded else None
+
+    async for chunk in stream:
+        text += chunk.text or ""
+        damages = _partial_damages(text)
+        # every element but the last is closed, the last one may still be growing
+        for damage in damages[parsed_count:-1]:
+            parsed_count += 1
+            decoded = decode(damage)
+            if decoded is not None:
+                yield "damage", {"index": sent, "damage": decoded}
+                sent += 1
+
+    result = parse_gemini_output(text)
+    if "error" not in result:
+        for damage in (result.get("damages") or [])[parsed_count:]:
+            decoded = decode(damage)
+            if decoded is not None:
+                yield "damage", {"index": sent, "damage": decoded}
+                sent += 1
+        if mode == "structured":
+            result = decode_structured_damages(result, image_names)
+    yield "result", result
+
+
+def plan_shards(count: int,
+                groups: Optional[List[Optional[str]]] = None,
+                shard_size: int = INSPECTION_SHARD_SIZE) -> List[List[int]]:
+    """
+    Splits image indices into evenly sized shards of at most shard_size.
+    Images with the same group (e.g. projection) stay together, otherwise the input order is kept.
+    """
+    grouped: Dict[Optional[str], List[int]] = {}
+    for index in range(count):
+        grouped.setdefault(groups[index] if groups else None, []).append(index)
+
+    shards = []
+    for indices in grouped.values():
+        # evenly sized shards instead of full ones and a small remainder
+        shard_count = -(-len(indices) // shard_size)
+        size = -(-len(indices) // shard_count)
+        shards.extend(indices[start:start + size] for start in range(0, len(indices), size))
+    return shards
+
+
+def merge_damages(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merges the damages of several shards. Views with the same (part, side, type, projection, segment)
+    are the same damage: their photos are combined and the damage is reported once.
+    """
+    merged: List[Dict[str, Any]] = []
+    # (part, side, type, projection, segment) -> (merged damage, its coordinate)
+    seen: Dict[Tuple, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+
+    for result in results:
+        for damage in result.get("damages", []):
+            if not isinstance(damage, dict):
+                continue
+            base = (damage.get("part"), damage.get("side"), damage.get("type"))
+            coordinates = [c for c in damage.get("coordinates") or [] if isinstance(c, dict)] or [{}]
+            keys = [base + (c.get("projection"), c.get("segment")) for c in coordinates]
+
+            target = next((seen[key][0] for key in keys if key in seen), None)
+            if target is None:
+                target = dict(damage, coordinates=[])
+                merged.append(target)
+
+            for coordinate, key in zip(coordinates, keys):
+                if key in seen:
+                    existing = seen[key][1]
+                    photos = existing.setdefault("photos", [])
+                    known = {(p.get("type"), p.get("photoId"), p.get("url")) for p in photos}
+                    photos.extend(p for p in coordinate.get("photos") or []
+                                  if (p.get("type"), p.get("photoId"), p.get("url")) not in known)
+                elif coordinate:
+                    coordinate = copy.deepcopy(coordinate)
+                    target["coordinates"].append(coordinate)
+                    seen[key] = (target, coordinate)
+                else:
+                    seen[key] = (target, {})
+    return {"damages": merged}
+
+
+async def _deduplicate(
+    image_urls: List[str],
+    blobs: List[bytes],
+    groups: List[Optional[str]],
+) -> Tuple[List[str], List[bytes], List[Optional[str]], Dict[str, List[str]]]:
+    """
+    Leaves out near-identical photos. Returns the remaining urls, blobs and groups
+    and, per remaining url, the urls of the photos it stands in for.
+    """
+    if not IMAGE_DEDUP_ENABLED or len(blobs) < 2:
+        return image_urls, blobs, groups, {}
+
+    representatives = await find_near_duplicates(blobs)
+    keep = [i for i, representative in enumerate(representatives) if i == representative]
+    aliases: Dict[str, List[str]] = {}
+    for i, representative in enumerate(representatives):
+        if i != representative and image_urls[i] != image_urls[representative]:
+            aliases.setdefault(image_urls[representative], []).append(image_urls[i])
+    if len(keep) < len(blobs):
+        logger.info("Deduplicated %d photo(s) to %d.", len(blobs), len(keep))
+    return [image_urls[i] for i in keep], [blobs[i] for i in keep], [groups[i] for i in keep], aliases
+
+
+def _expand_aliases(damage: Dict[str, Any], aliases: Dict[str, List[str]]) -> Dict[str, Any]:
+    """
+    Adds a photo reference for every alias of a photo the damage was found on
+    """
+    name_aliases = {url.split('/')[-1]: [alias.split('/')[-1] for alias in urls]
+                    for url, urls in aliases.items()}
+    for coordinate in damage.get("coordinates") or []:
+        if not isinstance(coordinate, dict):
+            continue
+        photos = coordinate.get("photos") or []
+        coordinate["photos"] = photos + [
+            dict(photo, photoId=alias)
+            for photo in photos if isinstance(photo, dict)
+            for alias in name_aliases.get(photo.get("photoId"), [])
+        ]
+    return damage
+
+
+async def _inspect_shards(
+    images: List[Tuple[bytes, str]],
+    image_names: List[str],
+    shards: List[List[int]],
+    concurrency: int = INSPECTION_SHARD_CONCURRENCY,
+) -> Tuple[List[Tuple[List[int], Dict[str, Any]]], List[Any]]:
+    """
+    Inspects the shards concurrently. Returns the (shard, result) pairs that succeeded
+    and the errors of those that did not.
+    """
+    limit = asyncio.Semaphore(concurrency)
+
+    async def inspect_shard(indices):
+        async with limit:
+            return await inspect_images([images[i] for i in indices], [image_names[i] for i in indices])
+
+    results = await asyncio.gather(*(inspect_shard(indices) for indices in shards), return_exceptions=True)
+    succeeded, failed = [], []
+    for indices, result in zip(shards, results):
+        if isinstance(result, dict) and "error" not in result:
+            succeeded.append((indices, result))
+        else:
+            logger.error("Shard of image(s) %s failed: %s", indices,
+                         result if isinstance(result, BaseException) else result.get("error"))
+            failed.append(result)
+    if len(shards) > 1:
+        logger.info("Inspected %d image(s) in %d shard(s), %d failed.", len(images), len(shards), len(failed))
+    return succeeded, failed
+
+
+def _combine(results: List[Dict[str, Any]], failed: List[Any]) -> Dict[str, Any]:
+    """
+    Merges shard results; if every shard failed the first error is returned (or raised)
+    """
+    if not results:
+        if isinstance(failed[0], BaseException):
+            raise failed[0]
+        return failed[0]
+    combined = results[0] if len(results) == 1 else merge_damages(results)
+    if failed:
+        combined = dict(combined, failed_shards=len(failed))
+    return combined
+
+
+async def inspect_in_shards(
+    images: List[Tuple[bytes, str]],
+    image_names: List[str],
+    groups: Optional[List[Optional[str]]] = None,
+    shard_size: int = INSPECTION_SHARD_SIZE,
+    concurrency: int = INSPECTION_SHARD_CONCURRENCY,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Inspects prepared images in concurrent shards and merges the damages.
+    Returns the merged result and the number of shards. Shards that fail are counted in
+    "failed_shards"; if every shard fails the first error is returned.
+    """
+    shards = plan_shards(len(images), groups, shard_size)
+    succeeded, failed = await _inspect_shards(images, image_names, shards, concurrency)
+    return _combine([result for _, result in succeeded], failed), len(shards)
+
+
+def _rename_photos(damage: Dict[str, Any], renames: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Replaces the photoIds of a damage found in an earlier submission by the current names
+    """
+    for coordinate in damage.get("coordinates") or []:
+        if not isinstance(coordinate, dict):
+            continue
+        for photo in coordinate.get("photos") or []:
+            if isinstance(photo, dict) and photo.get("photoId") in renames:
+                photo["photoId"] = renames[photo["photoId"]]
+    return damage
+
+
+def _stored_findings(hashes: List[str], names: List[str]) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """
+    Looks up the stored shards whose images are all part of this submission.
+    Returns their findings, with photoIds renamed to the names of this submission,
+    and the indices of the images none of them covers.
+    """
+    current_names = dict(zip(hashes, names))
+    reused: Dict[str, Dict[str, Any]] = {}
+    for image_hash in current_names:
+        shard_key = FINDINGS_CACHE.get(f"image:{INSPECTION_SIGNATURE}:{image_hash}")
+        if shard_key is None or shard_key in reused:
+            continue
+        shard = FINDINGS_CACHE.get(shard_key)
+        # a shard with a photo that has been removed since cannot be reused
+        if shard is not None and "names" in shard and set(shard["images"]) <= set(current_names):
+            reused[shard_key] = shard
+
+    covered = {image_hash for shard in reused.values() for image_hash in shard["images"]}
+    new = [i for i, image_hash in enumerate(hashes) if image_hash not in covered]
+    results = []
+    for shard in reused.values():
+        renames = {name: current_names[image_hash] for image_hash, name in shard["names"].items()}
+        result = shard["result"]
+        results.append(dict(result, damages=[_rename_photos(damage, renames)
+                                             for damage in result.get("damages", [])]))
+    return results, new
+
+
+def _store_findings(hashes: List[str], names: List[str], result: Dict[str, Any]):
+    """
+    Stores the findings of one inspected shard, with the name each image had in them,
+    and points each of its images to them
+    """
+    images = sorted(set(hashes))
+    shard_key = "shard:" + hashlib.sha256(
+        (INSPECTION_SIGNATURE + "".join(images)).encode("utf-8")).hexdigest()
+    FINDINGS_CACHE.set(shard_key, {"images": images, "names": dict(zip(hashes, names)), "result": result})
+    for image_hash in images:
+        FINDINGS_CACHE.set(f"image:{INSPECTION_SIGNATURE}:{image_hash}", shard_key)
+
+
+def _cache_result(cache_key: str, image_names: List[str], result: Dict[str, Any]):
+    """
+    Caches a result together with the image names it refers to
+    """
+    RESULT_CACHE.set(cache_key, {"names": image_names, "result": result})
+
+
+def _cached_result(cache_key: str, image_names: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Looks up a cached result; its photoIds are renamed to the names the same images have in this request
+    """
+    entry = RESULT_CACHE.get(cache_key)
+    if entry is None:
+        return None
+    renames = dict(zip(entry["names"], image_names))
+    result = copy.deepcopy(entry["result"])
+    return dict(result, damages=[_rename_photos(damage, renames) for damage in result.get("damages", [])])
+
+
+async def inspect_downloaded(
+    image_urls: List[str],
+    blobs: List[Optional[bytes]],
+    bypass_cache: bool = False,
+    groups: Optional[List[Optional[str]]] = None,
+) -> Dict[str, Any]:
+    """
+    Normalizes the downloaded images, runs the Gemini damage inspection and returns
+    {"result": ..., "cached": ..., "shards": ..., "reused_images": ..., "inspected_images": ..., "deduplication": ...}.
+    Results are cached by image content, model and parts configuration unless bypass_cache is set.
+    Near-identical photos are inspected once and reported under "deduplication".
+    Images already inspected in an earlier submission reuse their stored findings, so only
+    new images are sent to Gemini. More new images than INSPECTION_SHARD_SIZE are inspected
+    in shards, grouped by groups if given.
+    """
+    # failed downloads are left out of the prompt
+    downloaded_urls: List[str] = []
+    downloaded_blobs: List[bytes] = []
+    downloaded_groups: List[Optional[str]] = []
+    for index, (url, blob) in enumerate(zip(image_urls, blobs)):
+        if blob is None:
+            continue
+        downloaded_urls.append(url)
+        downloaded_blobs.append(blob)
+        downloaded_groups.append(groups[index] if groups else None)
+
+    if not downloaded_urls:
+        raise ValueError("None of the images could be downloaded.")
+
+    sharded = INSPECTION_SHARDING_ENABLED and len(downloaded_blobs) > INSPECTION_SHARD_SIZE
+    sharding = f"{INSPECTION_SHARD_SIZE}:{json.dumps(downloaded_groups)}" if sharded else ""
+    cache_key = result_cache_key(downloaded_blobs, sharding)
+    request_names = [url.split('/')[-1] for url in downloaded_urls]
+    if not bypass_cache:
+        cached_result = _cached_result(cache_key, request_names)
+        if cached_result is not None:
+            logger.info("Damage inspection served from the result cache.")
+            return {"result": cached_result, "cached": True, "shards": None,
+                    "reused_images": len(downloaded_blobs), "inspected_images": 0, "deduplication": None}
+
+    # near-identical photos are inspected once, their aliases are added back to the findings
+    submitted = len(downloaded_blobs)
+    downloaded_urls, downloaded_blobs, downloaded_groups, aliases = await _deduplicate(
+        downloaded_urls, downloaded_blobs, downloaded_groups)
+    deduplication = {"submitted_photos": submitted, "unique_photos": len(downloaded_blobs), "aliases": aliases}
+
+    hashes = [hashlib.sha256(blob).hexdigest() for blob in downloaded_blobs]
+    names = [url.split('/')[-1] for url in downloaded_urls]
+    results: List[Dict[str, Any]] = []
+    new = list(range(len(downloaded_blobs)))
+    if FINDINGS_CACHE is not None and not bypass_cache:
+        results, new = await asyncio.to_thread(_stored_findings, hashes, names)
+        if results:
+            logger.info("Reusing stored findings for %d of %d image(s).",
+                        len(downloaded_blobs) - len(new), len(downloaded_blobs))
+
+    failed: List[Any] = []
+    shards: List[List[int]] = []
+    if new:
+        images = await normalize_images([downloaded_blobs[i] for i in new])
+        logger.info("Images normalized: %d -> %d bytes.",
+                    sum(len(downloaded_blobs[i]) for i in new),
+                    sum(len(blob) for blob, _ in images))
+
+        image_names = [names[i] for i in new]
+        if INSPECTION_SHARDING_ENABLED and len(new) > INSPECTION_SHARD_SIZE:
+            shards = plan_shards(len(new), [downloaded_groups[i] for i in new])
+        else:
+            shards = [list(range(len(new)))]
+        succeeded, failed = await _inspect_shards(images, image_names, shards)
+
+        for indices, result in succeeded:
+            results.append(result)
+            if FINDINGS_CACHE is not None:
+                await asyncio.to_thread(_store_findings, [hashes[new[i]] for i in indices],
+                                        [names[new[i]] for i in indices], result)
+
+    result = _combine(results, failed)
+    if aliases and "error" not in result:
+        result = dict(result, damages=[_expand_aliases(copy.deepcopy(damage), aliases)
+                                       for damage in result.get("damages", [])])
+
+    # unparseable or partial output is not worth remembering
+    if "error" not in result and "failed_shards" not in result:
+        _cache_result(cache_key, request_names, result)
+    return {"result": result, "cached": False, "shards": len(shards) or None,
+            "reused_images": len(downloaded_blobs) - len(new), "inspected_images": len(new),
+            "deduplication": deduplication}
+
+
+async def batch_inspect(
+    image_urls: List[str],
+    bypass_cache: bool = False,
+) -> Dict[str, Any]:
+    """
+    Downloads all images concurrently and inspects them, see inspect_downloaded
+    """
+    blobs = await download_images(image_urls)
+    return await inspect_downloaded(image_urls, blobs, bypass_cache)
+
+
+async def stream_batch_inspect(
+    image_urls: List[str],
+    bypass_cache: bool = False,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Single-call variant of batch_inspect that yields ("damage", ...) events while Gemini
+    is still answering and finally ("result", {"result": ..., "cached": ...}).
+    """
+    blobs = await download_images(image_urls)
+    downloaded = [(url, blob) for url, blob in zip(image_urls, blobs) if blob is not None]
+    if not downloaded:
+        raise ValueError("None of the images could be downloaded.")
+    downloaded_blobs = [blob for _, blob in downloaded]
+
+    cache_key = result_cache_key(downloaded_blobs)
+    request_names = [url.split('/')[-1] for url, _ in downloaded]
+    if not bypass_cache:
+        cached_result = _cached_result(cache_key, request_names)
+        if cached_result is not None:
+            logger.info("Damage inspection served from the result cache.")
+            for index, damage in enumerate(cached_result.get("damages", [])):
+                yield "damage", {"index": index, "damage": damage}
+            yield "result", {"result": cached_result, "cached": True, "deduplication": None}
+            return
+
+    urls, downloaded_blobs, _, aliases = await _deduplicate(
+        [url for url, _ in downloaded], downloaded_blobs, [None] * len(downloaded_blobs))
+    deduplication = {"submitted_photos": len(downloaded), "unique_photos": len(downloaded_blobs), "aliases": aliases}
+
+    images = await normalize_images(downloaded_blobs)
+    result: Dict[str, Any] = {}
+    async for event, data in stream_inspection(images, [url.split('/')[-1] for url in urls]):
+        if event == "result":
+            result = data
+        else:
+            # the streamed damages may be the very objects of the final result, which is expanded on its own
+            yield event, dict(data, damage=_expand_aliases(copy.deepcopy(data["damage"]), aliases))
+
+    if aliases and "error" not in result:
+        result = dict(result, damages=[_expand_aliases(copy.deepcopy(damage), aliases)
+                                       for damage in result.get("damages", [])])
+    if "error" not in result:
+        _cache_result(cache_key, request_names, result)
+    yield "result", {"result": result, "cached": False, "deduplication": deduplication}
+
+
+async def case_inspect(
+    damage_case_id: str,
+    auth_token: Optional[str] = None,
+    source: str = DAMAGE_CASE_SOURCE,
+    bypass_cache: bool = False,
+) -> Dict[str, Any]:
+    """
+    Resolves the photos of a damage case, downloading each one as soon as its URL arrives,
+    and inspects them. Returns the inspection together with the photo -> coordinate mapping.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    urls: List[str] = []
+    tasks: List[asyncio.Task] = []
+
+    def on_photo_url(url: str):
+        urls.append(url)
+        tasks.append(asyncio.create_task(download_image(url)))
+
+    try:
+        cases = await fetch_case(damage_case_id, on_photo_url, auth_token, source)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    photos = case_photos(cases)
+    if not photos:
+        for task in tasks:
+            task.cancel()
+        raise CaseNotFoundError(f"No photos found for damage case {damage_case_id}.")
+
+    # a URL only visible in the complete response (e.g. a truncated last chunk) is fetched now
+    for photo in photos:
+        if photo["url"] not in urls:
+            on_photo_url(photo["url"])
+
+    # the download deadline counts from the start of the request, not from the end of the case lookup
+    blobs = await collect_downloads(urls, tasks, IMAGE_BATCH_DEADLINE - (loop.time() - started))
+    logger.info("Case %s: %d photo(s), %d unique URL(s), %d downloaded.",
+                damage_case_id, len(photos), len(urls), sum(blob is not None for blob in blobs))
+
+    # shards follow the projection of each photo, so views of the same side are inspected together
+    projections: Dict[str, Optional[str]] = {}
+    for photo in photos:
+        projections.setdefault(photo["url"], photo["projection"])
+    inspection = await inspect_downloaded(urls, blobs, bypass_cache,
+                                          groups=[projections.get(url) for url in urls])
+
+    downloaded = {url for url, blob in zip(urls, blobs) if blob is not None}
+    for photo in photos:
+        photo["downloaded"] = photo["url"] in downloaded
+    return dict(inspection, case_id=damage_case_id, photos=photos)
 
 
 class AnalyzeBatchRequest(BaseModel):
@@ -114,4 +841,27 @@ class AnalyzeBatchRequest(BaseModel):
             "https://example.com/photo1.jpg",
             "https://example.com/photo2.jpg",
         ],
-    )
\ No newline at end of file
+    )
+    bypass_cache: bool = Field(
+        False,
+        description="Skip the result cache and always run a fresh inspection",
+    )
+
+class AnalyzeCaseRequest(BaseModel):
+    case_id: str = Field(
+        ...,
+        description="damageCaseId of the case whose photos should be analyzed",
+        example="123456",
+    )
+    auth_token: Optional[str] = Field(
+        None,
+        description="Bearer token for the damage case API; the configured token is used if omitted",
+    )
+    source: str = Field(
+        DAMAGE_CASE_SOURCE,
+        description="Source system of the case",
+    )
+    bypass_cache: bool = Field(
+        False,
+        description="Skip the result cache and always run a fresh inspection",
+    )